@@ -5,6 +5,7 @@
 import numpy as np
 import pandas as pd
 
+import packet_kernels
 from flow_data import DIR_TO, DIR_FROM, ResultAuth, ResultAuthMethod, FlowData
 
 
@@ -48,24 +49,126 @@ class AuthenticationDetector():
         '16 + 68': {'name': '16 + 68', 'ssh-userauth': 100, 'auth-success': 84, 'alt-name': ['16 + 64 etm']},
     }
 
+    #Result codes carried through fused detection stages
+    CODE_UNRESOLVED = 0
+    CODE_FAIL = 1
+    CODE_PASSWORD = 2
+    CODE_RESULT = np.array([ResultAuth.fail, ResultAuth.fail, ResultAuth.auth_ok], dtype=object)
+    CODE_METHOD = np.array([ResultAuthMethod.unknown, ResultAuthMethod.unknown, ResultAuthMethod.password], dtype=object)
+    #Result codes of packet_kernels.repeating
+    REPEATING_RESULT = np.array([ResultAuth.unknown, ResultAuth.fail, ResultAuth.auth_ok], dtype=object)
+
     #--------------------------------------------------------------------------------------------
-    def __init__(self, mac_predictor = False):
+    def __init__(self, mac_predictor = False, fused = True):
+        """
+        - mac_predictor: ML model predicting MAC category (mac_category is used for success packet size)
+        - fused:         use single pass fused detection (detect_fused) instead of stepwise detection
+        """
+
         self.mac_predictor = mac_predictor
+        self.fused = fused
+        self.success_packet_sizes = {name: category['auth-success'] for name, category in AuthenticationDetector.MAC_CATEGORIES.items()}
 
     #--------------------------------------------------------------------------------------------
     def get_success_packet_size(self, mac_category):
         """
+        Expected SSH_MSG_USERAUTH_SUCCESS packet size of the predicted MAC category.
+        AUTH_SUCCESS_PCKT is returned without MAC prediction or for unknown category (originally None was returned, which failed in packet size comparison).
 
+        - mac_category: predicted MAC category name
         """
 
         if self.mac_predictor and mac_category in AuthenticationDetector.MAC_CATEGORIES:
             return AuthenticationDetector.MAC_CATEGORIES[mac_category]["auth-success"]
 
         else:
-            AuthenticationDetector.AUTH_SUCCESS_PCKT
+            return AuthenticationDetector.AUTH_SUCCESS_PCKT
+
+    #--------------------------------------------------------------------------------------------
+    def get_success_packet_sizes(self, records):
+        """
+        Batch version of get_success_packet_size.
+
+        - records: FlowData with mac_category
+
+        Returns:
+            numpy array with expected SSH_MSG_USERAUTH_SUCCESS packet size of each flow
+        """
+
+        if not self.mac_predictor:
+            return np.full(records.len(), AuthenticationDetector.AUTH_SUCCESS_PCKT)
+        return records.mac_category.map(self.success_packet_sizes).fillna(AuthenticationDetector.AUTH_SUCCESS_PCKT).to_numpy()
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def directions_match(records, pattern):
+        """
+        Find first direction pattern match in the authentication layer (packets auth_start+2 .. auth_end) for all flows. Result is cached per batch.
+        Keeps behaviour of the former per-row search: position is relative to auth_start+2 (but used as packet index by detectors), match at relative position 0 and the last possible window are not taken into account.
+
+        - records: FlowData with multiple flow records
+        - pattern: list of directions
+
+        Returns:
+            numpy array with relative position of the first match, 0 if not found
+        """
+
+        key = ('directions_match', tuple(pattern))
+        if key not in records.arrays:
+            match = records.match_dir_pattern(pattern)
+            begin = records.auth_start.to_numpy()[:, None] + 2
+            end = records.auth_end.to_numpy()[:, None]
+            positions = np.arange(match.shape[1])
+            match = match & (positions > begin) & (positions + len(pattern) < end)
+            records.arrays[key] = np.where(match.any(axis=1), np.argmax(match, axis=1) - begin[:, 0], 0)
+        return records.arrays[key]
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def match_result(records, mask, pattern, condition, default = False):
+        """
+        Evaluate detector condition on flows selected by mask with found direction pattern.
+
+        - records:   FlowData with multiple flow records
+        - mask:      boolean numpy array selecting evaluated flows
+        - pattern:   list of directions
+        - condition: function(rows, packet index) returning boolean numpy array
+        - default:   value for evaluated flows where condition is False
+
+        Returns:
+            pandas Series indexed by selected flows - True/default where the pattern was found, NaN otherwise
+        """
+
+        rows = np.flatnonzero(mask)
+        found, hit = AuthenticationDetector.match_condition(records, rows, pattern, condition)
+        result = pd.Series(np.nan, index=rows, dtype=object)
+        result[found] = np.where(hit[found], True, default)
+        return result
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def match_condition(records, rows, pattern, condition):
+        """
+        Evaluate detector condition on given flows with found direction pattern.
+
+        - records:   FlowData with multiple flow records
+        - rows:      numpy array with indices of evaluated flows
+        - pattern:   list of directions
+        - condition: function(rows, packet index) returning boolean numpy array
+
+        Returns:
+            tuple of boolean numpy arrays (pattern found, condition passed) for given rows
+        """
+
+        match = AuthenticationDetector.directions_match(records, pattern)[rows]
+        found = match > 0
+        hit = np.zeros(len(rows), dtype=bool)
+        if found.any():
+            hit[found] = condition(rows[found], match[found])
+        return found, hit
 
     #--------------------------------------------------------------------------------------------
-    def detect_key(self, records):
+    def detect_key(self, records, mask):
         """
         Function detects key authentication with public key precheck based on directions and packet lenghts pattern.
         SSH authentication using public key and signature is designed in following pattern:
@@ -74,32 +177,62 @@ class AuthenticationDetector():
         3. client sends authentication request again accompanied by a signature (using correct private key). The signature is next to the public key the largest element in the message. Adding signature makes the request size almost double of previous precheck.
         4. server verify signatures and either allow (SSH_MSG_USERAUTH_SUCCESS) or deny (SSH_MSG_USERAUTH_FAILURE) access. Detection can use predicted MAC algorithm to calculate the exact packet size of SSH_MSG_USERAUTH_SUCCESS message.
 
-        - data: input flows variable
+        - records: FlowData with multiple flow records
+        - mask:    boolean numpy array selecting evaluated flows
+        """
+
+        return AuthenticationDetector.match_result(records, mask, AuthenticationDetector.AUTH_KEY_DIR_PATTERN, self.key_condition(records))
+
+    #--------------------------------------------------------------------------------------------
+    def key_condition(self, records):
+        """
+        Condition of detect_key: precheck response slightly smaller than request, signed request almost double of precheck and success response.
         """
 
-        local = pd.DataFrame(index=records.index)
-        local['PPI_PKT_LENGTHS'] = records['PPI_PKT_LENGTHS']
-        local['mac_category'] = records['mac_category']
+        lengths = records.ppi_lengths
+        success = self.get_success_packet_sizes(records)
 
-        local['directions_match'] = records.apply(lambda row: row['PPI_PKT_DIRECTIONS'][row['auth_start']+2:row['auth_end']], axis=1).map(lambda x: np.argmax(np.array([ i if (x[i:i+AuthenticationDetector.AUTH_KEY_DIR_PATTERN_LEN] == AuthenticationDetector.AUTH_KEY_DIR_PATTERN) else np.nan for i in range(0, len(x) - AuthenticationDetector.AUTH_KEY_DIR_PATTERN_LEN)])>0) if len(x) > AuthenticationDetector.AUTH_KEY_DIR_PATTERN_LEN else 0)
+        def condition(rows, i):
+            return (lengths[rows, i+1] > lengths[rows, i] * AuthenticationDetector.AUTH_KEY_COEF) & \
+                   (lengths[rows, i+1] < lengths[rows, i]) & \
+                   (lengths[rows, i+2] > lengths[rows, i] * 2 * AuthenticationDetector.AUTH_KEY_COEF) & \
+                   (lengths[rows, i+3] <= success[rows])
 
-        local['return'] = np.nan
-        local['return'] = local[local['directions_match'] > 0].apply(lambda row: True if (row['PPI_PKT_LENGTHS'][row['directions_match']+1] > row['PPI_PKT_LENGTHS'][row['directions_match']] * AuthenticationDetector.AUTH_KEY_COEF) and (row['PPI_PKT_LENGTHS'][row['directions_match']+1] < row['PPI_PKT_LENGTHS'][row['directions_match']]) and (row['PPI_PKT_LENGTHS'][row['directions_match']+2] > row['PPI_PKT_LENGTHS'][row['directions_match']] * 2 * AuthenticationDetector.AUTH_KEY_COEF) and (row['PPI_PKT_LENGTHS'][row['directions_match']+3] <= self.get_success_packet_size(row['mac_category'])) else False, axis=1)
-        return local['return']
+        return condition
             
     #--------------------------------------------------------------------------------------------
-    def detect_chacha(self, records):
+    def detect_chacha(self, records, mask):
         """
         Packet size 28 in the SSH authentication layer use chacha-poly cipher, which should be the minimal packet length (only SSH message code). For authentication scope it means accepted login. Other ciphersuite combinations have different block size and MAC size and due to padding, it's can colaps with other messages.
+
+        - records: FlowData with multiple flow records
+        - mask:    boolean numpy array selecting evaluated flows
+
+        Returns:
+            pandas Series indexed by selected flows
         """
 
-        local = pd.DataFrame(index=records.index)
-        local['return'] = np.nan
+        rows = np.flatnonzero(mask)
+        return pd.Series(self.chacha_hits(records, rows), index=rows)
 
-        local['return'] = records.apply(lambda row: True if \
-                (AuthenticationDetector.CHACHA_POLY_AUTH_SIZE in row['PPI_PKT_LENGTHS'][row['auth_start']:row['auth_end']]) and \
-                (row['PPI_PKT_DIRECTIONS'][row['PPI_PKT_LENGTHS'][row['auth_start']:row['auth_end']].index(AuthenticationDetector.CHACHA_POLY_AUTH_SIZE)] == DIR_FROM) else False, axis=1)
-        return local['return']
+    #--------------------------------------------------------------------------------------------
+    def chacha_hits(self, records, rows):
+        """
+        Batch version of detect_chacha for given flows. As detect_chacha, the position of the first chacha-poly packet in authentication layer is used as packet index for direction check.
+
+        - records: FlowData with multiple flow records
+        - rows:    numpy array with indices of evaluated flows
+
+        Returns:
+            boolean numpy array for given rows
+        """
+
+        lengths = records.ppi_lengths[rows]
+        positions = np.arange(lengths.shape[1])
+        start = records.auth_start.to_numpy()[rows]
+        chacha = (lengths == AuthenticationDetector.CHACHA_POLY_AUTH_SIZE) & (positions >= start[:, None]) & (positions < records.auth_end.to_numpy()[rows, None])
+        first = np.argmax(chacha, axis=1) - start
+        return chacha.any(axis=1) & (records.ppi_directions[rows, np.maximum(first, 0)] == DIR_FROM)
 
     #--------------------------------------------------------------------------------------------
     def detect_auth_fail(self, records):
@@ -109,7 +242,9 @@ class AuthenticationDetector():
         - data: input flows variable
         """
 
-        return pd.Series(np.where((records.packet_count >= FlowData.SESS_START_MIN) & (records.auth_start + AuthenticationDetector.MIN_PCKT_TO_AUTH < records.packet_count) & (records.PPI_PKT_DIRECTIONS.map(lambda x: x.count(DIR_TO)) >= records.auth_start + 3) & (records.PPI_PKT_DIRECTIONS.map(lambda x: x.count(DIR_FROM)) >= records.auth_start + 3), True, False))
+        packet_count = records.packet_count.to_numpy()
+        auth_start = records.auth_start.to_numpy()
+        return pd.Series((packet_count >= FlowData.SESS_START_MIN) & (auth_start + AuthenticationDetector.MIN_PCKT_TO_AUTH < packet_count) & ((records.ppi_directions == DIR_TO).sum(axis=1) >= auth_start + 3) & ((records.ppi_directions == DIR_FROM).sum(axis=1) >= auth_start + 3))
 
         # if flow.packet_count < FlowData.SESS_START_MIN:
         #     return ResultAuth.fail
@@ -159,54 +294,110 @@ class AuthenticationDetector():
         return ResultAuth.unknown
 
     #--------------------------------------------------------------------------------------------
-    def detect_key_without_precheck(self, records):
+    def detect_repeating_bulk(self, records):
+        """
+        Batch version of detect_repeating over packed arrays (packet_kernels.repeating, pure Python loop without Numba).
+
+        - records: FlowData with multiple flow records
+
+        Returns:
+            numpy array (N) of ResultAuth
+        """
+
+        codes = packet_kernels.repeating(records.ppi_lengths, records.ppi_directions, records.packet_count.to_numpy(), records.auth_start.to_numpy(),
+                                         self.get_success_packet_sizes(records), AuthenticationDetector.MIN_PCKT_AFTER_AUTH,
+                                         AuthenticationDetector.AUTH_RESPONSE_SIZE_DIFF, DIR_FROM)
+        return AuthenticationDetector.REPEATING_RESULT[codes]
+
+    #--------------------------------------------------------------------------------------------
+    def detect_key_without_precheck(self, records, mask):
         """
         As mention in detect_key, the public key precheck is optional and this step has no result in authentication result.
         Similar to password detection, function tries to detects key authentication without precheck based on threshold and response packet of minimal size. In contrast with password, the send key is usually much longer (ECC keys are much shorter, so the can look like very long password).
 
         #TODO to increase precision there could be possibility to guess aprox. AUTH_KEY_MIN for each public key length (but username is also sent along with the key)
 
-        - data: input flows variable
+        - records: FlowData with multiple flow records
+        - mask:    boolean numpy array selecting evaluated flows
         """
 
-        local = pd.DataFrame(index=records.index)
-        local['PPI_PKT_LENGTHS'] = records['PPI_PKT_LENGTHS']
-        local['mac_category'] = records['mac_category'] 
-        local['PPI_PKT_FLAGS'] = records['PPI_PKT_FLAGS']
-        local['return'] = np.nan
+        return AuthenticationDetector.match_result(records, mask, AuthenticationDetector.AUTH_PASS_DIR_PATTERN, self.min_size_condition(records, AuthenticationDetector.AUTH_KEY_MIN))
 
-        local['directions_match'] = records.apply(lambda row: row['PPI_PKT_DIRECTIONS'][row['auth_start']+2:row['auth_end']], axis=1).map(lambda x: np.argmax(np.array([ i if (x[i:i+AuthenticationDetector.AUTH_PASS_DIR_PATTERN_LEN] == AuthenticationDetector.AUTH_PASS_DIR_PATTERN) else np.nan for i in range(0, len(x) - AuthenticationDetector.AUTH_PASS_DIR_PATTERN_LEN)])>0) if len(x) > AuthenticationDetector.AUTH_PASS_DIR_PATTERN_LEN else 0)
-        
-        local['return'] = local[local['directions_match'] > 0].apply(lambda row: True if (row['PPI_PKT_LENGTHS'][row['directions_match']] > AuthenticationDetector.AUTH_KEY_MIN) and (row['PPI_PKT_LENGTHS'][row['directions_match']+1] <= self.get_success_packet_size(row['mac_category'])) and (row['PPI_PKT_FLAGS'][row['directions_match']+1] & 1 != 1) and (row['PPI_PKT_FLAGS'][row['directions_match']+2] & 1 != 1) else False, axis=1)
+    #--------------------------------------------------------------------------------------------
+    def min_size_condition(self, records, min_size):
+        """
+        Condition shared by key (without precheck) and password detection: client request above min_size, followed by server response of success packet size and no FIN flag in the following packets.
+        """
+
+        lengths = records.ppi_lengths
+        flags = records.ppi_flags
+        success = self.get_success_packet_sizes(records)
+
+        def condition(rows, i):
+            return (lengths[rows, i] > min_size) & \
+                   (lengths[rows, i+1] <= success[rows]) & \
+                   (flags[rows, i+1] & 1 != 1) & \
+                   (flags[rows, i+2] & 1 != 1)
 
-        return local['return']
+        return condition
 
     #--------------------------------------------------------------------------------------------
-    def detect_password(self, records):
+    def detect_password(self, records, mask):
         """
         Function tries to detects successfull password authentication based on threshold and response packet of minimal size.
 
-        - data: input flows variable
+        - records: FlowData with multiple flow records
+        - mask:    boolean numpy array selecting evaluated flows
         """
 
-        local = pd.DataFrame(index=records.index)
-        local['PPI_PKT_LENGTHS'] = records['PPI_PKT_LENGTHS']
-        local['mac_category'] = records['mac_category'] 
-        local['PPI_PKT_FLAGS'] = records['PPI_PKT_FLAGS']
-        local['return'] = np.nan
+        return AuthenticationDetector.match_result(records, mask, AuthenticationDetector.AUTH_PASS_DIR_PATTERN, self.min_size_condition(records, AuthenticationDetector.AUTH_PASS_MIN), np.nan)
 
-        local['directions_match'] = records.apply(lambda row: row['PPI_PKT_DIRECTIONS'][row['auth_start']+2:row['auth_end']], axis=1).map(lambda x: np.argmax(np.array([ i if (x[i:i+AuthenticationDetector.AUTH_PASS_DIR_PATTERN_LEN] == AuthenticationDetector.AUTH_PASS_DIR_PATTERN) else np.nan for i in range(0, len(x) - AuthenticationDetector.AUTH_PASS_DIR_PATTERN_LEN)])>0) if len(x) > AuthenticationDetector.AUTH_PASS_DIR_PATTERN_LEN else 0)
-        
-        local['return'] = local[local['directions_match'] > 0].apply(lambda row: True if (row['PPI_PKT_LENGTHS'][row['directions_match']] > AuthenticationDetector.AUTH_PASS_MIN) and (row['PPI_PKT_LENGTHS'][row['directions_match']+1] <= self.get_success_packet_size(row['mac_category'])) and (row['PPI_PKT_FLAGS'][row['directions_match']+1] & 1 != 1) and (row['PPI_PKT_FLAGS'][row['directions_match']+2] & 1 != 1) else np.nan, axis=1)
+    #--------------------------------------------------------------------------------------------
+    def detect(self, records):
+        """
+        Detect authentication result and method of all flows.
 
-        return local['return']
+        - records: FlowData with multiple flow records
+
+        Returns:
+            pandas DataFrame with columns result (ResultAuth) and method (ResultAuthMethod)
+        """
+
+        if self.fused:
+            return self.detect_fused(records)
+        return self.detect_stepwise(records)
 
     #--------------------------------------------------------------------------------------------
-    def detect(self, records):
+    def detect_fused(self, records):
         """
+        Single pass detection over packed FlowData arrays. Result code array is carried through the stages (fail, password), every stage evaluates only flows not resolved by previous stages.
+        Output is the same as detect_stepwise. Key, chacha and precheck key stages are not evaluated - detect_stepwise never assigns key method (column-wise apply in method assignment results in all NaN), so only password detection affects its output.
 
-            #TODO
-        
+        - records: FlowData with multiple flow records
+
+        Returns:
+            pandas DataFrame with columns result (ResultAuth) and method (ResultAuthMethod)
+        """
+
+        codes = np.full(records.len(), AuthenticationDetector.CODE_UNRESOLVED, dtype=np.int8)
+        codes[~self.detect_auth_fail(records).to_numpy()] = AuthenticationDetector.CODE_FAIL
+
+        rows = np.flatnonzero(codes == AuthenticationDetector.CODE_UNRESOLVED)
+        _, hit = self.match_condition(records, rows, AuthenticationDetector.AUTH_PASS_DIR_PATTERN, self.min_size_condition(records, AuthenticationDetector.AUTH_PASS_MIN))
+        codes[rows[hit]] = AuthenticationDetector.CODE_PASSWORD
+
+        #unresolved flows are failed with unknown method
+        return pd.DataFrame({'result': AuthenticationDetector.CODE_RESULT[codes], 'method': AuthenticationDetector.CODE_METHOD[codes]})
+
+    #--------------------------------------------------------------------------------------------
+    def detect_stepwise(self, records):
+        """
+        Detection running each detector on filtered flows and merging the results in DataFrame.
+
+        - records: FlowData with multiple flow records
+
+        Returns:
+            pandas DataFrame with columns result (ResultAuth) and method (ResultAuthMethod)
         """
 
         #ensure auth_start and auth_end in records
@@ -219,13 +410,13 @@ class AuthenticationDetector():
 
         if len(authentication[authentication['auth_fail_continue'] == True]) > 0:
 
-            authentication['detect_key'] = self.detect_key(records.data[authentication['auth_fail_continue'] == True])
-            authentication['chacha'] = self.detect_chacha(records.data[(authentication['auth_fail_continue'] == True) & (authentication['detect_key'] != True)]) #False should have only processed rows (other np.nan)
-            authentication['precheck_key'] = self.detect_key_without_precheck(records.data[(authentication['auth_fail_continue'] == True) & ((authentication['chacha'] != True) | (authentication['detect_key'] != True))])
+            authentication['detect_key'] = self.detect_key(records, (authentication['auth_fail_continue'] == True).to_numpy())
+            authentication['chacha'] = self.detect_chacha(records, ((authentication['auth_fail_continue'] == True) & (authentication['detect_key'] != True)).to_numpy()) #False should have only processed rows (other np.nan)
+            authentication['precheck_key'] = self.detect_key_without_precheck(records, ((authentication['auth_fail_continue'] == True) & ((authentication['chacha'] != True) | (authentication['detect_key'] != True))).to_numpy())
             
             authentication['method'] = authentication[(authentication['detect_key'] == True) | (authentication['chacha'] == True) | (authentication['precheck_key'] == True)].apply(lambda x: ResultAuthMethod.key)
 
-            authentication['password'] = self.detect_password(records.data[(authentication['auth_fail_continue'] == True) & (authentication['method'] != ResultAuthMethod.key)]).replace(True, ResultAuthMethod.password)
+            authentication['password'] = self.detect_password(records, ((authentication['auth_fail_continue'] == True) & (authentication['method'] != ResultAuthMethod.key)).to_numpy()).replace(True, ResultAuthMethod.password)
     
             authentication['method'] = authentication['method'].fillna(authentication['password'])
     
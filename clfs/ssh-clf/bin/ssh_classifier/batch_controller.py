@@ -0,0 +1,82 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import math
+import threading
+
+
+#------------------------------------------------------------------------------------------------
+class BatchController():
+    """
+    Adaptive recvBulk size and timeout controller targeting flow latency SLO.
+    Flow waits in recvBulk (at most timeout) and then for processing of its batch (batch latency from reception to export, including queue wait). Timeout gets the part of SLO not consumed by batch latency, so under low load flows are not held for the whole static timeout.
+    Batch size grows when batches wait in the queue (consumer falls behind, larger batches amortize per-batch overhead) and shrinks when batch latency alone exceeds SLO.
+    """
+
+    #Smoothing of batch latency (EWMA weight of the last batch)
+    SMOOTHING = 0.3
+    GROW = 1.25
+    SHRINK = 0.8
+    MIN_COUNT = 100
+    #Upper limit of recvBulk size if it is not limited (max_count <= 0)
+    MAX_COUNT = 100000
+    #Batch size at start, grows while batches wait in the queue
+    INITIAL_COUNT = 1000
+    #pytrap recvBulk timeout is whole seconds
+    MIN_TIMEOUT = 1
+
+    #--------------------------------------------------------------------------------------------
+    def __init__(self, slo, max_count = 10000, max_timeout = 10):
+        """
+        - slo:          target flow latency in seconds (from reception to export)
+        - max_count:    upper limit of recvBulk size, <= 0 means no limit (MAX_COUNT is used)
+        - max_timeout:  upper limit of recvBulk timeout in seconds
+        """
+
+        self.slo = slo
+        self.max_count = max(max_count, BatchController.MIN_COUNT) if max_count > 0 else BatchController.MAX_COUNT
+        self.max_timeout = max(max_timeout, BatchController.MIN_TIMEOUT)
+        self.count = min(self.max_count, BatchController.INITIAL_COUNT)
+        self.timeout = min(self.max_timeout, max(BatchController.MIN_TIMEOUT, math.floor(slo)))
+        self.latency = None
+        self.lock = threading.Lock()
+
+    #--------------------------------------------------------------------------------------------
+    def settings(self):
+        """
+        Returns:
+            tuple (recvBulk count, recvBulk timeout) for the next receive
+        """
+
+        with self.lock:
+            return self.count, self.timeout
+
+    #--------------------------------------------------------------------------------------------
+    def update(self, latency, queue_depth, stats = None):
+        """
+        Adapt settings after a batch is exported.
+
+        - latency:     batch latency in seconds (reception to export)
+        - queue_depth: number of batches waiting for processing
+        - stats:       optional PipelineStats to report current settings
+        """
+
+        with self.lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += BatchController.SMOOTHING * (latency - self.latency)
+
+            if queue_depth > 0:
+                self.count = min(self.max_count, int(self.count * BatchController.GROW))
+            elif self.latency > self.slo:
+                self.count = max(BatchController.MIN_COUNT, int(self.count * BatchController.SHRINK))
+
+            self.timeout = min(self.max_timeout, max(BatchController.MIN_TIMEOUT, math.floor(self.slo - self.latency)))
+
+            if stats is not None:
+                stats.set_gauge('recv_messages', self.count)
+                stats.set_gauge('recv_timeout', self.timeout)
+
+    #--------------------------------------------------------------------------------------------
@@ -0,0 +1,89 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import os
+import glob
+import numpy as np
+import pandas as pd
+from flow_data import FlowData
+
+
+#------------------------------------------------------------------------------------------------
+class BatchRecorder():
+    """
+    Capture of received SSH flow batches (after SSH filter, before preprocess) for offline replay and profiling.
+    Every batch is stored as one uncompressed NumPy .npz file with packed arrays (FlowData.DETACHED_ARRAYS), packet_count and exported flow fields (FlowData.SCALAR_FIELDS), no pickled objects. IP addresses are stored as strings and times as float seconds, so replay does not need pytrap.
+    Reception time relative to the capture start is stored with each batch to allow real-time paced replay.
+    """
+
+    PREFIX = 'batch_'
+    TIME_FIELDS = ['TIME_FIRST', 'TIME_LAST']
+
+    #--------------------------------------------------------------------------------------------
+    def __init__(self, directory):
+        """
+        - directory: output directory (created if it does not exist)
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.count = 0
+        self.start = None
+
+    #--------------------------------------------------------------------------------------------
+    def record(self, records):
+        """
+        Store one batch.
+
+        - records: FlowData after SSH filter (not preprocessed)
+        """
+
+        if self.start is None:
+            self.start = records.received
+
+        columns = {}
+        for field in FlowData.SCALAR_FIELDS:
+            column = records.data[field]
+            if pd.api.types.is_numeric_dtype(column):
+                columns[field] = column.to_numpy()
+            elif field in BatchRecorder.TIME_FIELDS:
+                columns[field] = np.fromiter((value.getTimeAsFloat() for value in column), dtype=np.float64, count=len(column))
+            else:
+                columns[field] = column.astype(str).to_numpy(dtype=str)
+
+        arrays = {key: getattr(records, key) for key in FlowData.DETACHED_ARRAYS}
+        path = os.path.join(self.directory, f'{BatchRecorder.PREFIX}{self.count:08d}.npz')
+        np.savez(path, received=records.received - self.start, packet_count=records.packet_count.to_numpy(), **columns, **arrays)
+        self.count += 1
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def load(path):
+        """
+        Load one stored batch.
+
+        - path: .npz file path
+
+        Returns:
+            tuple (FlowData, reception time relative to the capture start in seconds)
+        """
+
+        with np.load(path, allow_pickle=False) as batch:
+            records = FlowData([])
+            records.data = pd.DataFrame({field: batch[field] for field in FlowData.SCALAR_FIELDS})
+            records.data['packet_count'] = batch['packet_count']
+            records.arrays = {key: batch[key] for key in FlowData.DETACHED_ARRAYS}
+            received = float(batch['received'])
+        return records, received
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def paths(directory):
+        """
+        Stored batch files in the capture order.
+        """
+
+        return sorted(glob.glob(os.path.join(directory, f'{BatchRecorder.PREFIX}*.npz')))
+
+    #--------------------------------------------------------------------------------------------
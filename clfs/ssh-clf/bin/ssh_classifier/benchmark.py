@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+
+from ssh_classifier import SSHClassifier
+from flow_generator import FlowGenerator
+
+try:
+    import pytrap
+except ImportError:
+    pytrap = None
+
+
+#------------------------------------------------------------------------------------------------
+class StubTrap():
+    """
+    Replacement of pytrap TrapCtx used by SSHClassifier. recvBulk returns the prepared batch, send only counts messages.
+    """
+
+    def __init__(self):
+        self.pending = []
+        self.sent = 0
+
+    def recvBulk(self, ifc, time = -1, count = -1):
+        bulk, self.pending = self.pending, []
+        return bulk
+
+    def send(self, data, ifc = 0):
+        self.sent += 1
+
+    def finalize(self):
+        pass
+
+#------------------------------------------------------------------------------------------------
+class StubTemplate():
+    """
+    Replacement of output pytrap UnirecTemplate, fields are only stored.
+    """
+
+    def getData(self):
+        return b''
+
+#------------------------------------------------------------------------------------------------
+def load_trapcap(path, count):
+    """
+    Read all flow records from trapcap file (requires pytrap).
+
+    - path:  trapcap file path
+    - count: recvBulk size
+    """
+
+    if pytrap is None:
+        raise Exception('Reading trapcap requires pytrap.')
+
+    trap = pytrap.TrapCtx()
+    trap.init(['-i', f'f:{path}'], 1, 0)
+    trap.setRequiredFmt(0, pytrap.FMT_UNIREC, SSHClassifier.SINGLE_IFC_PYTRAP_INPUT_SPECIFICATION)
+    ifc = pytrap.UnirecTemplate(SSHClassifier.SINGLE_IFC_PYTRAP_INPUT_SPECIFICATION)
+
+    flows = []
+    while True:
+        try:
+            bulk = trap.recvBulk(ifc, time = -1, count = count)
+        except pytrap.TerminatedError:
+            break
+        if len(bulk) == 0:
+            break
+        flows.extend(bulk)
+    trap.finalize()
+    return flows
+
+#------------------------------------------------------------------------------------------------
+def copy_batch(batch):
+    """
+    Copy flow records with PPI lists, which are modified in place by preprocess (the same source batch is used repeatedly).
+    """
+
+    return [{**flow, "PPI_PKT_DIRECTIONS": flow["PPI_PKT_DIRECTIONS"][:], "PPI_PKT_FLAGS": flow["PPI_PKT_FLAGS"][:],
+             "PPI_PKT_LENGTHS": flow["PPI_PKT_LENGTHS"][:], "PPI_PKT_TIMES": flow["PPI_PKT_TIMES"][:]} for flow in batch]
+
+#------------------------------------------------------------------------------------------------
+def run(classifier, batches, flows):
+    """
+    Drive classifier over the source batches (repeated if needed) until the given number of flows is processed.
+    Only fetch_record (FlowData construction), do_detection and export are measured.
+
+    Returns:
+        tuple (processed flows, measured seconds)
+    """
+
+    trap = classifier.trap
+    processed = 0
+    elapsed = 0.0
+    i = 0
+    while processed < flows:
+        bulk = copy_batch(batches[i % len(batches)][:flows - processed])
+        i += 1
+        trap.pending = bulk
+
+        start = time.perf_counter()
+        records = classifier.fetch_record()
+        if records.len() > 0:
+            classifier.do_detection(records)
+            classifier.export(records)
+        elapsed += time.perf_counter() - start
+        processed += len(bulk)
+
+    return processed, elapsed
+
+#------------------------------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(prog='SSH classifier benchmark', description='Offline throughput benchmark of SSH classifier without NEMEA pipeline.')
+    parser.add_argument('--mac-classifier-path', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ssh-mac-classifier.pkl'), help='Path to the python pkl object with MAC classifier')
+    parser.add_argument('--trapcap', default=None, help='Read flows from trapcap file (requires pytrap) instead of synthetic generator')
+    parser.add_argument('--flows', default=100000, type=int, help='Number of processed flows (source batches are repeated)')
+    parser.add_argument('--batch', default=10000, type=int, help='Batch size (recvBulk count)')
+    parser.add_argument('--unique_batches', default=10, type=int, help='Number of different generated batches')
+    parser.add_argument('--seed', default=0, type=int, help='Synthetic generator seed')
+    parser.add_argument('--ssh_ratio', default=0.85, type=float, help='Ratio of SSH flows in synthetic data')
+    parser.add_argument('--flat_model', action='store_true', help='Predict MAC category by flattened tree ensemble instead of scikit-learn')
+    parser.add_argument('--mac_cache_size', default=0, type=int, help='Max number of cached MAC category predictions (e.g. 4096), 0 disables the cache')
+    parser.add_argument('--scan_fast_path', action='store_true', help='Mark flows which cannot contain authentication as failed without MAC prediction and detectors')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    #prepare source data before measurement
+    if args.trapcap is not None:
+        flows = load_trapcap(args.trapcap, args.batch)
+        batches = [flows[i:i + args.batch] for i in range(0, len(flows), args.batch)]
+    else:
+        generator = FlowGenerator(args.seed, args.ssh_ratio)
+        batches = [generator.batch(args.batch) for _ in range(max(1, min(args.unique_batches, -(-args.flows // args.batch))))]
+    if len(batches) == 0:
+        raise Exception('No input flows.')
+
+    classifier = SSHClassifier(args.mac_classifier_path, flat_model = args.flat_model, mac_cache_size = args.mac_cache_size, scan_fast_path = args.scan_fast_path)
+    classifier.trap = StubTrap()
+    classifier.alert = StubTemplate()
+
+    processed, elapsed = run(classifier, batches, args.flows)
+    stats = classifier.stats.snapshot()
+
+    result = {
+        'flows': processed,
+        'ssh_flows': stats['counters']['flows_ssh'],
+        'batches': stats['counters']['batches'],
+        'seconds': elapsed,
+        'flows_per_second': processed / elapsed if elapsed > 0 else None,
+        'ssh_flows_per_second': stats['counters']['flows_ssh'] / elapsed if elapsed > 0 else None,
+        'latency_p50_ms': stats['latency_p50_ms'],
+        'latency_p99_ms': stats['latency_p99_ms'],
+        'stages': {name: stage['total'] for name, stage in stats['stages'].items()},
+        'fast_path_flows': stats['counters'].get('flows_fast_path'),
+        'mac_cache_hit_rate': classifier.mac_cache.hit_rate() if classifier.mac_cache is not None else None,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"flows {result['flows']} (ssh {result['ssh_flows']}) in {result['batches']} batches, {result['seconds']:.3f} s")
+    print(f"throughput {result['flows_per_second']:.0f} flows/s (ssh {result['ssh_flows_per_second']:.0f} flows/s)")
+    if result['latency_p50_ms'] is not None:
+        print(f"batch latency p50 {result['latency_p50_ms']:.1f} ms, p99 {result['latency_p99_ms']:.1f} ms")
+    for name, seconds in result['stages'].items():
+        print(f"  {name:<16} {seconds:8.3f} s {seconds / elapsed * 100:6.1f} %")
+    if result['fast_path_flows'] is not None:
+        print(f"scan fast path {result['fast_path_flows']} flows")
+    if result['mac_cache_hit_rate'] is not None:
+        print(f"mac cache hit rate {result['mac_cache_hit_rate'] * 100:.1f} %")
+    print(f"peak RSS {result['peak_rss_mb']:.1f} MB")
+
+#------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    main()
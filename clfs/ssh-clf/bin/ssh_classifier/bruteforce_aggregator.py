@@ -0,0 +1,247 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import numpy as np
+import pandas as pd
+from flow_data import ResultAuth
+
+
+#------------------------------------------------------------------------------------------------
+class SlidingWindowTable():
+    """
+    Fixed size table of sliding window counters of authentication results.
+    Key is mapped to a row of preallocated arrays, every row is a ring of time buckets (bucket epoch = time // bucket length) with one counter per result class and the first/last flow time. Bucket is reset when it is reused for a newer epoch, so the window sum is the sum of buckets with epoch in the window.
+    Rows of keys without any flow in the window are released on expire. Flows of new keys are dropped when the table is full, flows older than the window of the newest flow are dropped as well.
+    """
+
+    #--------------------------------------------------------------------------------------------
+    def __init__(self, buckets, max_keys, classes):
+        """
+        - buckets:  number of time buckets in the window
+        - max_keys: maximal number of keys (table rows)
+        - classes:  number of counted result classes
+        """
+
+        self.buckets = buckets
+        self.max_keys = max_keys
+        self.index = {}
+        self.keys = [None] * max_keys
+        self.free = list(range(max_keys - 1, -1, -1))
+        self.counts = np.zeros((max_keys, buckets, classes), dtype=np.uint32)
+        self.epochs = np.full((max_keys, buckets), -1, dtype=np.int64)
+        self.first = np.zeros((max_keys, buckets))
+        self.last = np.zeros((max_keys, buckets))
+        self.updated = np.full(max_keys, -1, dtype=np.int64)
+        self.dropped = 0
+
+    #--------------------------------------------------------------------------------------------
+    def len(self):
+        return len(self.index)
+
+    #--------------------------------------------------------------------------------------------
+    def rows(self, keys):
+        """
+        Get table rows of the given keys, rows are allocated for new keys.
+
+        Returns:
+            numpy array with row of every key, -1 if the table is full
+        """
+
+        index = self.index
+        rows = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            row = index.get(key)
+            if row is None:
+                if len(self.free) == 0:
+                    rows[i] = -1
+                    continue
+                row = self.free.pop()
+                index[key] = row
+                self.keys[row] = key
+                self.counts[row] = 0
+                self.epochs[row] = -1
+            rows[i] = row
+        return rows
+
+    #--------------------------------------------------------------------------------------------
+    def add(self, keys, epochs, times, classes):
+        """
+        Count flows into buckets of their keys.
+
+        - keys:    list of hashable keys (values in text form, pytrap objects do not guarantee hash of equal values)
+        - epochs:  numpy array of bucket epochs of the flows
+        - times:   numpy array of flow times (seconds)
+        - classes: numpy array of result class indices
+        """
+
+        #flows older than the window of the newest flow would share ring buckets with newer ones
+        fresh = np.flatnonzero(epochs > epochs.max(initial=0) - self.buckets)
+        if len(fresh) < len(keys):
+            self.dropped += len(keys) - len(fresh)
+            keys, epochs, times, classes = [keys[i] for i in fresh], epochs[fresh], times[fresh], classes[fresh]
+
+        rows = self.rows(keys)
+        valid = rows >= 0
+        self.dropped += int((~valid).sum())
+        rows, epochs, times, classes = rows[valid], epochs[valid], times[valid], classes[valid]
+        ring = epochs % self.buckets
+
+        #bucket of an older epoch is reused, flows older than the bucket epoch are out of the window
+        stored = self.epochs[rows, ring]
+        reset = stored < epochs
+        self.counts[rows[reset], ring[reset]] = 0
+        self.epochs[rows[reset], ring[reset]] = epochs[reset]
+        self.first[rows[reset], ring[reset]] = np.inf
+        self.last[rows[reset], ring[reset]] = -np.inf
+        current = stored <= epochs
+
+        rows, epochs, times, ring, classes = rows[current], epochs[current], times[current], ring[current], classes[current]
+        np.add.at(self.counts, (rows, ring, classes), 1)
+        np.minimum.at(self.first, (rows, ring), times)
+        np.maximum.at(self.last, (rows, ring), times)
+        np.maximum.at(self.updated, rows, epochs)
+
+    #--------------------------------------------------------------------------------------------
+    def window(self, epoch, since):
+        """
+        Window sums and flow times of keys updated since the given epoch.
+
+        - epoch: current bucket epoch (last bucket of the window)
+        - since: only keys updated in a later epoch are returned
+
+        Returns:
+            tuple (list of keys, numpy array (keys x classes) with window sums, numpy arrays with first and last flow time in the window)
+        """
+
+        rows = np.fromiter(self.index.values(), dtype=np.int64, count=len(self.index))
+        rows = rows[self.updated[rows] > since]
+        in_window = (self.epochs[rows] > epoch - self.buckets) & (self.epochs[rows] <= epoch)
+        sums = (self.counts[rows] * in_window[:, :, None]).sum(axis=1)
+        first = np.where(in_window, self.first[rows], np.inf).min(axis=1, initial=np.inf)
+        last = np.where(in_window, self.last[rows], -np.inf).max(axis=1, initial=-np.inf)
+        return [self.keys[row] for row in rows], sums, first, last
+
+    #--------------------------------------------------------------------------------------------
+    def expire(self, epoch):
+        """
+        Release rows of keys without flows in the window ending by the given epoch.
+        """
+
+        expired = [key for key, row in self.index.items() if self.updated[row] <= epoch - self.buckets]
+        for key in expired:
+            row = self.index.pop(key)
+            self.keys[row] = None
+            self.updated[row] = -1
+            self.free.append(row)
+        return len(expired)
+
+    #--------------------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------------------------
+class BruteForceAggregator():
+    """
+    Aggregation of authentication results into sliding window counters per (SRC_IP, DST_IP) and per SRC_IP.
+    Instead of a record per flow, one summary record per active key is emitted every window (keys with a flow since the previous summary), with counts of failed, successful and unknown authentications in the last window. Time is taken from flows (TIME_LAST), so summaries are emitted when flows of the next window are received (or on flush).
+    """
+
+    #counted classes (summary columns)
+    CLASSES = {ResultAuth.fail: 0, ResultAuth.auth_ok: 1, ResultAuth.unknown: 2}
+    COUNT_COLUMNS = ['AUTH_FAIL', 'AUTH_OK', 'AUTH_UNKNOWN']
+    SUMMARY_COLUMNS = ['SRC_IP', 'DST_IP', 'TIME_FIRST', 'TIME_LAST', 'FLOWS', 'AUTH_FAIL', 'AUTH_OK', 'AUTH_UNKNOWN', 'AGGREGATION']
+    PAIR = 'src_dst'
+    SOURCE = 'src'
+
+    #--------------------------------------------------------------------------------------------
+    def __init__(self, window = 60, buckets = 12, max_keys = 65536):
+        """
+        - window:   sliding window length in seconds (also the summary period)
+        - buckets:  number of time buckets of the window (counter resolution)
+        - max_keys: maximal number of tracked keys of each table
+        """
+
+        if window <= 0 or buckets < 1 or max_keys < 1:
+            raise Exception(f'Invalid aggregation settings: window {window}, buckets {buckets}, max_keys {max_keys}.')
+
+        self.window = window
+        self.buckets = buckets
+        self.bucket_length = window / buckets
+        self.pairs = SlidingWindowTable(buckets, max_keys, len(BruteForceAggregator.CLASSES))
+        self.sources = SlidingWindowTable(buckets, max_keys, len(BruteForceAggregator.CLASSES))
+        self.epoch = None
+        self.emitted = -1
+
+    #--------------------------------------------------------------------------------------------
+    def update(self, records, stats = None):
+        """
+        Count authentication results of classified records.
+
+        - records: FlowData with detection results
+        - stats:   optional PipelineStats with table sizes and dropped flows
+
+        Returns:
+            pandas DataFrame with summaries (SUMMARY_COLUMNS) if the window ended, otherwise None
+        """
+
+        data = records.data
+        if len(data) == 0:
+            return None
+        if pd.api.types.is_numeric_dtype(data['TIME_LAST']):
+            times = data['TIME_LAST'].to_numpy(dtype=np.float64)
+        else:
+            #pytrap UnirecTime values
+            times = np.fromiter((t.getTimeAsFloat() for t in data['TIME_LAST']), dtype=np.float64, count=len(data))
+        epochs = np.floor(times / self.bucket_length).astype(np.int64)
+        classes = np.fromiter((BruteForceAggregator.CLASSES.get(result, 2) for result in data['result']), dtype=np.int64, count=len(data))
+        #keys are compared in text form (as SSHClassifier.shard_ids)
+        sources = data['SRC_IP'].astype(str).tolist()
+        destinations = data['DST_IP'].astype(str).tolist()
+
+        dropped = self.pairs.dropped + self.sources.dropped
+        self.pairs.add(list(zip(sources, destinations)), epochs, times, classes)
+        self.sources.add(sources, epochs, times, classes)
+
+        epoch = int(epochs.max())
+        if self.epoch is None:
+            self.epoch = epoch
+            self.emitted = epoch - 1
+        self.epoch = max(self.epoch, epoch)
+
+        if stats is not None:
+            stats.count('aggregation_dropped', self.pairs.dropped + self.sources.dropped - dropped)
+            stats.set_gauge('aggregation_keys', self.pairs.len() + self.sources.len())
+
+        #summary of every key is emitted once per window
+        if self.epoch - self.emitted >= self.buckets:
+            return self.flush()
+        return None
+
+    #--------------------------------------------------------------------------------------------
+    def flush(self):
+        """
+        Emit summaries of keys updated since the previous summary and release idle keys.
+
+        Returns:
+            pandas DataFrame with summaries (SUMMARY_COLUMNS), None if nothing was counted
+        """
+
+        if self.epoch is None:
+            return None
+
+        summaries = []
+        for table, kind in ((self.pairs, BruteForceAggregator.PAIR), (self.sources, BruteForceAggregator.SOURCE)):
+            keys, sums, first, last = table.window(self.epoch, self.emitted)
+            summary = pd.DataFrame(sums.astype(np.int64), columns=BruteForceAggregator.COUNT_COLUMNS)
+            summary.insert(0, 'SRC_IP', [key[0] for key in keys] if kind == BruteForceAggregator.PAIR else keys)
+            summary.insert(1, 'DST_IP', [key[1] for key in keys] if kind == BruteForceAggregator.PAIR else [None] * len(keys))
+            summary.insert(2, 'TIME_FIRST', first)
+            summary.insert(3, 'TIME_LAST', last)
+            summary.insert(4, 'FLOWS', sums.sum(axis=1).astype(np.int64))
+            summary['AGGREGATION'] = kind
+            summaries.append(summary[summary['FLOWS'] > 0])
+            table.expire(self.epoch)
+
+        self.emitted = self.epoch
+        return pd.concat(summaries, ignore_index=True)
+
+    #--------------------------------------------------------------------------------------------
@@ -6,7 +6,9 @@ import numpy as np
 import pandas as pd
 from enum import Enum
 from enum import auto as auto_id
-import pandas as pd
+from itertools import chain
+import time
+import packet_kernels
 
 # Constants
 #------------------------------------------------------------------------------------------------
@@ -45,6 +47,7 @@ class FlowData():
     Data container for a single Unirec flow record.
     Class also provide several supporting calculating functions for common variables used accross detectors (e.g. index position of the packet with 16B size). For detector independency it could be either inside every detector (duplicate calculation) or unified in separated object as designed here.
     Class manage calculated values in a lazy way. This means class calculate requested value only if asked for and store result for later use.
+    Per-packet (PPI) and histogram list columns are packed into fixed-width zero padded 2D NumPy arrays (one flow per row) on first access, so the calculated values are vectorized array operations over the whole batch instead of per-row Python lambdas.
     """
 
     #Constants
@@ -52,6 +55,37 @@ class FlowData():
     FILTER_MIN_BYTES_ONE_DIR = 60
     FILTER_MIN_PACKETS_ONE_DIR = 6
 
+    #Columnar layout
+    PPI_MAX_LEN = 30    #default pstats length, packed arrays are wider only if some flow exceeds it
+    PHISTS_LEN = 8
+
+    #Flow fields stored in DataFrame when array fields are decoded into RecordBuffer (exported flow fields)
+    SCALAR_FIELDS = ["DST_IP", "SRC_IP", "BYTES", "BYTES_REV", "LINK_BIT_FIELD", "TIME_FIRST", "TIME_LAST", "PACKETS", "PACKETS_REV", "DST_PORT", "SRC_PORT"]
+
+    #Feature registry - calculated values (function _name) and calculated values they depend on, raw Unirec columns are not listed
+    FEATURES = {
+        'packet_count': [],
+        'ppi_lengths': ['packet_count'],
+        'ppi_directions': ['packet_count'],
+        'ppi_flags': ['packet_count'],
+        'ppi_times': ['packet_count'],
+        'valid_mask': ['ppi_lengths', 'packet_count'],
+        's_phists_sizes': [],
+        'd_phists_sizes': [],
+        'pckt_16_index': ['ppi_lengths'],
+        'auth_start': ['pckt_16_index', 'ppi_lengths', 'ppi_directions', 'packet_count'],
+        'auth_end': ['packet_count'],
+        'hist_src_size': ['s_phists_sizes'],
+        'hist_dst_size': ['d_phists_sizes'],
+        'hist_src_size_major': ['hist_src_size'],
+        'hist_src_size_perc': ['hist_src_size'],
+        'hist_dst_size_major': ['hist_dst_size'],
+        'hist_dst_size_perc': ['hist_dst_size'],
+    }
+
+    #Values kept in detached copy (everything detectors need, without pytrap objects)
+    DETACHED_COLUMNS = ['packet_count', 'auth_start']
+    DETACHED_ARRAYS = ['ppi_lengths', 'ppi_directions', 'ppi_flags', 'ppi_times', 's_phists_sizes', 'd_phists_sizes']
 
 
     #Thresholds
@@ -61,19 +95,42 @@ class FlowData():
     SSH_USERAUTH_VALUES = {32, 36, 40, 44, 48, 52, 56, 60, 64, 68, 88, 92, 96, 100}
     PRE_AUTH_DIR_PATTERN = [DIR_TO, DIR_FROM, DIR_TO, DIR_FROM] #SSH_MSG_SERVICE 2x
     PRE_AUTH_DIR_PATTERN_LEN = 4
+    #lookup tables for compiled kernels (packet_kernels)
+    SSH_USERAUTH_TABLE = np.isin(np.arange(max(SSH_USERAUTH_VALUES) + 1), list(SSH_USERAUTH_VALUES))
+    PRE_AUTH_DIR_ARRAY = np.array(PRE_AUTH_DIR_PATTERN, dtype=np.int8)
 
     #--------------------------------------------------------------------------------------------
-    def __init__(self, bulkRecords):
+    def __init__(self, bulkRecords, buffer = None):
         """
         Initialize object with flow data.
         
         Expecting list of dictionaries.
+        With RecordBuffer, array fields are decoded into the buffer and only SCALAR_FIELDS are stored in pandas DataFrame (PPI list columns are not available).
         """
 
+        #packed 2D arrays (calculated values which cannot be stored as DataFrame column)
+        self.arrays = {}
+        #calculation time of each calculated value (in seconds, dependencies not included) in the calculation order
+        self.timings = {}
+        #reception time (time.monotonic) for end-to-end latency
+        self.received = time.monotonic()
+
+        #RecordBuffer holding packed arrays of this batch
+        self.buffer = None
+        #FlowData with follow-up records of tracked sessions received in the same batch (SessionTracker), exported with this batch
+        self.continued = None
+
         if len(bulkRecords) > 0:
-            #filter out non-SSH traffic and save as pandas DataFrame
-            self.data = FlowData.filter_ssh(pd.DataFrame(bulkRecords))
-            self.data.reset_index(inplace=True, drop=True)
+            #filter out non-SSH traffic before building pandas DataFrame (only SSH flows are materialized)
+            records = [record for record in bulkRecords if FlowData.is_ssh(record)]
+            packed = buffer.fill(records) if buffer is not None and len(records) > 0 else None
+            if packed is not None:
+                self.buffer = buffer
+                self.data = pd.DataFrame(records, columns=FlowData.SCALAR_FIELDS)
+                self.data['packet_count'] = packed.pop('packet_count')
+                self.arrays.update(packed)
+            else:
+                self.data = pd.DataFrame(records)
 
         else:
             self.data = pd.DataFrame()
@@ -82,26 +139,60 @@ class FlowData():
     def len(self):
         return self.data.shape[0]
 
+    #--------------------------------------------------------------------------------------------
+    def detach(self):
+        """
+        Create copy of the flow data containing only calculated values and packed arrays needed by detectors (DETACHED_COLUMNS, DETACHED_ARRAYS).
+        Detached copy holds only numpy data, so it can be pickled and send to other process (pytrap values as IP addresses and times are left out).
+
+        Returns:
+            FlowData
+        """
+
+        detached = FlowData([])
+        detached.data = pd.DataFrame({key: getattr(self, key).to_numpy() for key in FlowData.DETACHED_COLUMNS})
+        detached.arrays = {key: getattr(self, key) for key in FlowData.DETACHED_ARRAYS}
+        return detached
+
+    #--------------------------------------------------------------------------------------------
+    def subset(self, rows):
+        """
+        Create flow data of the selected flows, including already calculated values and packed arrays.
+
+        Args:
+            rows: numpy array of selected flow positions
+
+        Returns:
+            FlowData (flows are indexed from 0)
+        """
+
+        subset = FlowData([])
+        subset.data = self.data.iloc[rows].reset_index(drop=True)
+        subset.arrays = {key: value[rows] for key, value in self.arrays.items()}
+        return subset
+
     #--------------------------------------------------------------------------------------------
     @staticmethod
-    def filter_ssh(df):
+    def is_ssh(record):
         """
-        Filter valid SSH traffic (bidirectional) based on constant parameters in FlowData class variables. Function check if the flow record is valid SSH traffic, connection contains enough data packet in both directions and START with client to server direction.
+        Filter of valid SSH traffic (bidirectional) for a single raw flow record (dictionary from recvBulk), applied before pandas DataFrame is built. Flow record has to contain enough data packets in both directions and START with client to server direction.
+        Cheap counter checks are evaluated first, so most of non-SSH flows are rejected without touching the payload.
 
         Args:
-            df: pandas DataFrame with Unirec flows records values in rows
+            record: dictionary with Unirec flow record values
 
         Returns:
-            filtered pandas DataFrame containing valid bidirectional SSH traffic
+            True if the flow record is valid bidirectional SSH traffic
         """
-        
-        return df[(df["IDP_CONTENT"].str.startswith(FlowData.FILTER_SSH_string)) & \
-                    (df["IDP_CONTENT_REV"].str.startswith(FlowData.FILTER_SSH_string)) & \
-                    (df["BYTES"] >= FlowData.FILTER_MIN_BYTES_ONE_DIR) & \
-                    (df["BYTES_REV"] >= FlowData.FILTER_MIN_BYTES_ONE_DIR) & \
-                    (df["PACKETS"] >= FlowData.FILTER_MIN_PACKETS_ONE_DIR) & \
-                    (df["PACKETS_REV"] >= FlowData.FILTER_MIN_PACKETS_ONE_DIR) & \
-                    (df["PPI_PKT_DIRECTIONS"].str[0] == DIR_TO)]
+
+        directions = record["PPI_PKT_DIRECTIONS"]
+        return record["PACKETS"] >= FlowData.FILTER_MIN_PACKETS_ONE_DIR and \
+                record["PACKETS_REV"] >= FlowData.FILTER_MIN_PACKETS_ONE_DIR and \
+                record["BYTES"] >= FlowData.FILTER_MIN_BYTES_ONE_DIR and \
+                record["BYTES_REV"] >= FlowData.FILTER_MIN_BYTES_ONE_DIR and \
+                len(directions) > 0 and directions[0] == DIR_TO and \
+                record["IDP_CONTENT"].startswith(FlowData.FILTER_SSH_string) and \
+                record["IDP_CONTENT_REV"].startswith(FlowData.FILTER_SSH_string)
 
     #--------------------------------------------------------------------------------------------
     def __getattr__(self, key):
@@ -111,19 +202,216 @@ class FlowData():
         Args:
             key: requested flow attribute
         Returns:
-            pandas Series column with requested flow attribute
+            pandas Series column (or 2D numpy array for packed values) with requested flow attribute
         """
 
+        #special attributes (e.g. pickle protocol) and container attributes before initialization are never calculated
+        if key.startswith('__') or key in ('data', 'arrays', 'timings', 'received', 'buffer', 'continued'):
+            raise AttributeError(key)
+
         #check if searched attribute exists or try to add it
         if key in self.data:
             return self.data[key]
+        elif key in self.arrays:
+            return self.arrays[key]
         elif hasattr(self.__class__, f'_{key}') and callable(getattr(self.__class__, f'_{key}')):
+            #calculate declared dependencies first, so timing belongs only to the requested value
+            for dependency in FlowData.FEATURES.get(key, []):
+                getattr(self, dependency)
+
             #get reference to function by getattr and CALL it as function
-            self.data[key] = getattr(self, f'_{key}')(self)
+            start = time.perf_counter()
+            value = getattr(self, f'_{key}')(self)
+            self.timings[key] = time.perf_counter() - start
+            if np.ndim(value) > 1:
+                self.arrays[key] = value
+                return value
+            self.data[key] = value
             return self.data[key]
         else:
             raise Exception(f'Unknown function to calculate requested flow attribute {key}.')
 
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def resolve(features):
+        """
+        Order requested features and all their dependencies from FEATURES registry, so every feature follows its dependencies (topological order).
+
+        Args:
+            features: list of requested feature names
+
+        Returns:
+            list of feature names in calculation order
+        """
+
+        order = []
+        visiting = set()
+
+        def visit(feature):
+            if feature in order:
+                return
+            if feature not in FlowData.FEATURES:
+                raise Exception(f'Unknown feature {feature}.')
+            if feature in visiting:
+                raise Exception(f'Cyclic dependency of feature {feature}.')
+            visiting.add(feature)
+            for dependency in FlowData.FEATURES[feature]:
+                visit(dependency)
+            visiting.remove(feature)
+            order.append(feature)
+
+        for feature in features:
+            visit(feature)
+        return order
+
+    #--------------------------------------------------------------------------------------------
+    def compute(self, features):
+        """
+        Calculate requested features (and their dependencies) for the whole batch in dependency order. Already calculated values are reused.
+
+        Args:
+            features: list of requested feature names
+
+        Returns:
+            dict with calculation time (in seconds) of features calculated by this call
+        """
+
+        computed = {}
+        for feature in FlowData.resolve(features):
+            if feature not in self.data and feature not in self.arrays:
+                getattr(self, feature)
+                computed[feature] = self.timings[feature]
+        return computed
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def pack(column, counts, width, dtype, convert=None):
+        """
+        Pack pandas Series of lists into 2D numpy array of fixed width, rows shorter than width are padded by zeros.
+
+        Args:
+            column: pandas Series with list values
+            counts: numpy array with number of valid values in each row
+            width:  number of columns of the packed array
+            dtype:  numpy dtype of the packed array
+            convert: optional function applied to every value (e.g. UnirecTime to float)
+
+        Returns:
+            numpy array of shape (len(column), width)
+        """
+
+        packed = np.zeros((len(column), width), dtype=dtype)
+        values = chain.from_iterable(column)
+        if convert is not None:
+            values = map(convert, values)
+        #boolean mask assignment fills values in row-major order, which is the order of chained lists
+        packed[np.arange(width) < counts[:, None]] = np.fromiter(values, dtype=dtype, count=int(counts.sum()))
+        return packed
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def pack_ppi(flowdata, column, dtype, convert=None):
+        """
+        Pack PPI list column into 2D numpy array (N x PPI_MAX_LEN) using packet_count as valid length of each row.
+        """
+
+        counts = flowdata.packet_count.to_numpy()
+        return FlowData.pack(flowdata.data[column], counts, max(FlowData.PPI_MAX_LEN, counts.max(initial=0)), dtype, convert)
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def _ppi_lengths(flowdata):
+        """
+        Returns:
+            numpy array (N x PPI_MAX_LEN) with packet lengths, padded by 0
+        """
+
+        #int32 instead of uint16 - merged packets (preprocess) can exceed uint16
+        return FlowData.pack_ppi(flowdata, "PPI_PKT_LENGTHS", np.int32)
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def _ppi_directions(flowdata):
+        """
+        Returns:
+            numpy array (N x PPI_MAX_LEN) with packet directions, padded by 0 (neither DIR_TO nor DIR_FROM)
+        """
+
+        return FlowData.pack_ppi(flowdata, "PPI_PKT_DIRECTIONS", np.int8)
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def _ppi_flags(flowdata):
+        """
+        Returns:
+            numpy array (N x PPI_MAX_LEN) with packet TCP flags, padded by 0
+        """
+
+        return FlowData.pack_ppi(flowdata, "PPI_PKT_FLAGS", np.uint8)
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def _ppi_times(flowdata):
+        """
+        Returns:
+            numpy array (N x PPI_MAX_LEN) with packet timestamps as float seconds, padded by 0
+        """
+
+        return FlowData.pack_ppi(flowdata, "PPI_PKT_TIMES", np.float64, lambda t: t.getTimeAsFloat())
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def _valid_mask(flowdata):
+        """
+        Returns:
+            boolean numpy array (N x PPI_MAX_LEN) marking real (not padded) packets
+        """
+
+        return np.arange(flowdata.ppi_lengths.shape[1]) < flowdata.packet_count.to_numpy()[:, None]
+
+    #--------------------------------------------------------------------------------------------
+    def match_dir_pattern(self, pattern):
+        """
+        Match direction pattern at every window position of every flow in one pass (shifted comparisons over packed directions).
+        Result is cached per batch, so all detectors searching the same pattern share it.
+
+        Args:
+            pattern: list of directions (DIR_TO/DIR_FROM)
+
+        Returns:
+            boolean numpy array (N x width-len(pattern)+1), True where the pattern starts at the position
+        """
+
+        key = ('dir_pattern', tuple(pattern))
+        if key not in self.arrays:
+            directions = self.ppi_directions
+            windows = directions.shape[1] - len(pattern) + 1
+            match = np.ones((self.len(), windows), dtype=bool)
+            for i, direction in enumerate(pattern):
+                match &= directions[:, i:i + windows] == direction
+            self.arrays[key] = match
+        return self.arrays[key]
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def _s_phists_sizes(flowdata):
+        """
+        Returns:
+            numpy array (N x PHISTS_LEN) with source packet size histogram
+        """
+
+        return FlowData.pack(flowdata.S_PHISTS_SIZES, np.full(flowdata.len(), FlowData.PHISTS_LEN), FlowData.PHISTS_LEN, np.uint32)
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def _d_phists_sizes(flowdata):
+        """
+        Returns:
+            numpy array (N x PHISTS_LEN) with destination packet size histogram
+        """
+
+        return FlowData.pack(flowdata.D_PHISTS_SIZES, np.full(flowdata.len(), FlowData.PHISTS_LEN), FlowData.PHISTS_LEN, np.uint32)
+
     #--------------------------------------------------------------------------------------------
     @staticmethod
     def _pckt_16_index(flowdata):
@@ -136,7 +424,9 @@ class FlowData():
         """
 
         #Due to performance use last 16B packet index - implemented as find first in reversed list, instead of first find 16B packet and look further until non-16B packet size was found (which is not exactly the same behaviour, and if causing errors it will have to change back)
-        return flowdata.PPI_PKT_LENGTHS.map(lambda row: (len(row) - row[::-1].index(16) - 1) if 16 in row else 0)
+        is_16 = flowdata.ppi_lengths == 16    #padding is 0, so only valid packets can match
+        last = is_16.shape[1] - 1 - np.argmax(is_16[:, ::-1], axis=1)
+        return np.where(is_16.any(axis=1), last, 0)
 
     #--------------------------------------------------------------------------------------------
     @staticmethod
@@ -152,9 +442,8 @@ class FlowData():
         """
 
 
-        df = flowdata.data
         #if failing, try to do min from "PPI_PKT_LENGTHS", "PPI_PKT_DIRECTIONS", "PPI_PKT_TIMES"
-        return df["PPI_PKT_LENGTHS"].map(len)
+        return np.fromiter(map(len, flowdata.data["PPI_PKT_LENGTHS"]), dtype=np.int64, count=flowdata.len())
 
     #--------------------------------------------------------------------------------------------
     @staticmethod
@@ -189,10 +478,44 @@ class FlowData():
         - data: input flows variable
         """
         
-        tmp = flowdata.pckt_16_index.map(lambda x: x+1 if x > 0 else np.nan)
-        if tmp.isnull().any():
-            tmp = tmp.fillna(flowdata.data[tmp.isna()].apply(lambda x: FlowData.auth_start_pattern(x) if len(x['PPI_PKT_LENGTHS']) > FlowData.SESS_START_MIN else 0, axis=1))
-        return tmp.astype('int')
+        tmp = flowdata.pckt_16_index.to_numpy() + 1
+        missing = tmp == 1
+        if missing.any():
+            tmp[missing] = FlowData.auth_start_bulk(flowdata)[missing]
+        return tmp
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def auth_start_bulk(flowdata):
+        """
+        Batch version of auth_start_pattern over packed arrays (flows with at most SESS_START_MIN packets get 0).
+        Position is the first index from AUTH_INIT_THRESHOLD matching 'ssh-userauth' request/response pair or PRE_AUTH_DIR_PATTERN.
+
+        Returns:
+            numpy array (N) with guessed auth start positions (0 if not found)
+        """
+
+        lengths = flowdata.ppi_lengths
+        directions = flowdata.ppi_directions
+        counts = flowdata.packet_count.to_numpy()
+        if packet_kernels.COMPILED:
+            return packet_kernels.auth_start_pattern(lengths, directions, counts, FlowData.SSH_USERAUTH_TABLE, FlowData.PRE_AUTH_DIR_ARRAY,
+                                                     FlowData.AUTH_INIT_THRESHOLD, FlowData.SESS_START_MIN)
+
+        #SSH_MSG_SERVICE_REQUEST and response: same size, opposite directions, valid 'ssh-userauth' size
+        userauth = (lengths[:, :-1] == lengths[:, 1:]) & (directions[:, :-1] != directions[:, 1:]) & \
+                   np.isin(lengths[:, :-1], list(FlowData.SSH_USERAUTH_VALUES))
+
+        hit = flowdata.match_dir_pattern(FlowData.PRE_AUTH_DIR_PATTERN).copy()
+        windows = hit.shape[1]
+        hit |= userauth[:, :windows]
+
+        #searched range as in auth_start_pattern
+        columns = np.arange(windows)
+        hit &= (columns >= FlowData.AUTH_INIT_THRESHOLD) & (columns < (counts - FlowData.PRE_AUTH_DIR_PATTERN_LEN)[:, None])
+        hit &= (counts > FlowData.SESS_START_MIN)[:, None]
+
+        return np.where(hit.any(axis=1), hit.argmax(axis=1), 0)
 
 
     #--------------------------------------------------------------------------------------------
@@ -214,19 +537,62 @@ class FlowData():
 
     #--------------------------------------------------------------------------------------------
     @staticmethod
-    def _hist_src_size_major(flowdata):
+    def hist_major(hists):
         """
-        Get the indices of the most frequent hist source size bin         
+        Most frequent bin of every histogram and its ratio to the histogram sum, computed in one pass over the packed histograms.
+        Ratio of empty histogram (zero sum) is 0.
 
         Args:
-            pandas DataFrame (should have columns: ["S_PHISTS_SIZES"])
+            hists: numpy array (N x PHISTS_LEN) of packed histograms
+
+        Returns:
+            numpy array (N x 2) with the most frequent bin index and its ratio in columns
+        """
+
+        major = np.argmax(hists, axis=1)
+        count = np.take_along_axis(hists, major[:, None], axis=1)[:, 0]
+        total = hists.sum(axis=1)
+        result = np.zeros((hists.shape[0], 2))
+        result[:, 0] = major
+        #zero sum histograms keep ratio 0 (no division)
+        np.divide(count, total, out=result[:, 1], where=total > 0)
+        return result
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def _hist_src_size(flowdata):
+        """
+        Most frequent hist source size bin and its ratio (see hist_major).
+
+        Returns:
+            numpy array (N x 2) with bin indices and ratios
+        """
+
+        return FlowData.hist_major(flowdata.s_phists_sizes)
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def _hist_dst_size(flowdata):
+        """
+        Most frequent hist destination size bin and its ratio (see hist_major).
+
+        Returns:
+            numpy array (N x 2) with bin indices and ratios
+        """
+
+        return FlowData.hist_major(flowdata.d_phists_sizes)
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def _hist_src_size_major(flowdata):
+        """
+        Get the indices of the most frequent hist source size bin         
 
         Returns:
-            pandas Series with indices of the most frequent hist source size bin
+            numpy array with indices of the most frequent hist source size bin
         """
     
-        #get most frequent hist bin
-        return flowdata.S_PHISTS_SIZES.map(lambda x: x.index(max(x)))
+        return flowdata.hist_src_size[:, 0].astype(np.int64)
 
     #--------------------------------------------------------------------------------------------
     @staticmethod
@@ -234,15 +600,11 @@ class FlowData():
         """
         Get the normalized percental value of the major hist source size bin         
 
-        Args:
-            pandas DataFrame (should have columns: ["S_PHISTS_SIZES"])
-
         Returns:
-            pandas Series with normalized (percental) values of the major hist source size bin
+            numpy array with normalized (percental) values of the major hist source size bin, 0 for empty histogram
         """
 
-        #normalize the major histogram bin to percental values
-        return flowdata.S_PHISTS_SIZES.map(lambda x: max(x) / sum(x))
+        return flowdata.hist_src_size[:, 1]
     
     #--------------------------------------------------------------------------------------------
     @staticmethod
@@ -250,15 +612,11 @@ class FlowData():
         """
         Get the indices of the most frequent hist destination size bin         
 
-        Args:
-            pandas DataFrame (should have columns: ["D_PHISTS_SIZES"])
-
         Returns:
-            pandas Series with indices of the most frequent hist destination size bin
+            numpy array with indices of the most frequent hist destination size bin
         """
     
-        #get most frequent hist bin
-        return flowdata.D_PHISTS_SIZES.map(lambda x: x.index(max(x)))
+        return flowdata.hist_dst_size[:, 0].astype(np.int64)
 
     #--------------------------------------------------------------------------------------------
     @staticmethod
@@ -266,14 +624,10 @@ class FlowData():
         """
         Get the normalized percental value of the major hist destination size bin         
 
-        Args:
-            pandas DataFrame (should have columns: ["D_PHISTS_SIZES"])
-
         Returns:
-            pandas Series with normalized (percental) values of the major hist destination size bin
+            numpy array with normalized (percental) values of the major hist destination size bin, 0 for empty histogram
         """
 
-        #normalize the major histogram bin to percental values
-        return flowdata.D_PHISTS_SIZES.map(lambda x: max(x) / sum(x))
+        return flowdata.hist_dst_size[:, 1]
 
     #--------------------------------------------------------------------------------------------
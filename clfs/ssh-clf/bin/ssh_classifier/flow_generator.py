@@ -0,0 +1,191 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import random
+from flow_data import DIR_TO, DIR_FROM, FlowData
+
+try:
+    from pytrap import UnirecTime, UnirecIPAddr
+except ImportError:
+    UnirecTime = None
+    UnirecIPAddr = str
+
+
+#------------------------------------------------------------------------------------------------
+class SyntheticTime(float):
+    """
+    Minimal replacement of pytrap UnirecTime (seconds as float) for runs without NEMEA.
+    """
+
+    def getTimeAsFloat(self):
+        return float(self)
+
+#------------------------------------------------------------------------------------------------
+class FlowGenerator():
+    """
+    Generator of synthetic flow records in the recvBulk format (list of dictionaries with SINGLE_IFC_PYTRAP_INPUT_SPECIFICATION fields).
+    Flows follow SSH protocol phases (version exchange, KEX, NEWKEYS, SSH_MSG_SERVICE_REQUEST, authentication, session) with packet sizes padded for a random ciphersuite (block size, MAC size, EtM), so all detectors have realistic work. Part of the flows is non-SSH or mangled (scans, incomplete handshakes).
+    """
+
+    #(block size, MAC size, EtM length) of generated ciphersuites
+    CIPHERSUITES = [(8, 16, 0), (16, 16, 0), (8, 20, 0), (16, 12, 0), (16, 32, 0), (8, 12, 4), (16, 16, 4), (16, 64, 0), (8, 8, 0)]
+    TCP_ACK = 16
+    TCP_PSH_ACK = 24
+
+    #--------------------------------------------------------------------------------------------
+    def __init__(self, seed = 0, ssh_ratio = 0.85, mangled_ratio = 0.2):
+        """
+        - seed:          random seed (generated data are reproducible)
+        - ssh_ratio:     ratio of SSH flows, the rest is rejected by SSH filter
+        - mangled_ratio: ratio of flows with random packet sequence (scans, broken handshakes)
+        """
+
+        self.rng = random.Random(seed)
+        self.ssh_ratio = ssh_ratio
+        self.mangled_ratio = mangled_ratio
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def packet_size(bs, ms, etm, payload):
+        """
+        Encrypted SSH packet size (packet length, padding length, payload, min 4B padding to block size and MAC).
+        """
+
+        size = payload + 4 + 1 + 4
+        size += (etm - size) % bs
+        return size + ms
+
+    #--------------------------------------------------------------------------------------------
+    def time(self, value):
+        return UnirecTime(value) if UnirecTime is not None else SyntheticTime(value)
+
+    #--------------------------------------------------------------------------------------------
+    def packets(self):
+        """
+        Generate packet sequence of one flow.
+
+        Returns:
+            tuple of lists (lengths, directions, flags)
+        """
+
+        rng = self.rng
+        bs, ms, etm = rng.choice(FlowGenerator.CIPHERSUITES)
+        lengths, directions, flags = [], [], []
+
+        def add(length, direction, flag = FlowGenerator.TCP_PSH_ACK):
+            lengths.append(length)
+            directions.append(direction)
+            flags.append(flag)
+
+        if rng.random() < self.mangled_ratio:
+            for i in range(rng.randint(3, FlowData.PPI_MAX_LEN)):
+                add(rng.choice([0, 16, 20, 28, 32, 36, 44, 48, 52, 64, 92, 100, 300, 1000]), DIR_TO if i == 0 else rng.choice([DIR_TO, DIR_FROM]), rng.choice([FlowGenerator.TCP_ACK, FlowGenerator.TCP_PSH_ACK]))
+            return lengths, directions, flags
+
+        #version exchange, KEXINIT, KEX DH
+        add(rng.randint(20, 45), DIR_TO)
+        add(rng.randint(20, 45), DIR_FROM)
+        add(rng.randint(800, 1500), DIR_TO)
+        add(rng.randint(800, 1500), DIR_FROM)
+        if rng.random() < 0.3:
+            add(0, DIR_TO, FlowGenerator.TCP_ACK)
+        add(rng.choice([48, 64]), DIR_TO)
+        add(rng.randint(200, 600), DIR_FROM)
+
+        #NEWKEYS
+        if rng.random() < 0.9:
+            add(16, DIR_TO)
+
+        #SSH_MSG_SERVICE_REQUEST 'ssh-userauth' and response
+        service = FlowGenerator.packet_size(bs, ms, etm, 12)
+        add(service, DIR_TO)
+        add(service, DIR_FROM)
+
+        kind = rng.random()
+        if kind < 0.3:
+            #password accepted
+            add(FlowGenerator.packet_size(bs, ms, etm, rng.randint(30, 80)), DIR_TO)
+            add(FlowGenerator.packet_size(bs, ms, etm, 1), DIR_FROM)
+        elif kind < 0.5:
+            #public key: precheck, signature, success
+            key = FlowGenerator.packet_size(bs, ms, etm, rng.randint(300, 500))
+            add(key, DIR_TO)
+            add(key - rng.randint(20, 60), DIR_FROM)
+            add(FlowGenerator.packet_size(bs, ms, etm, 900), DIR_TO)
+            add(FlowGenerator.packet_size(bs, ms, etm, 1), DIR_FROM)
+        else:
+            #failed attempts (brute-force)
+            for _ in range(rng.randint(1, 4)):
+                add(FlowGenerator.packet_size(bs, ms, etm, rng.randint(30, 80)), DIR_TO)
+                add(FlowGenerator.packet_size(bs, ms, etm, 40), DIR_FROM)
+
+        #session
+        for _ in range(rng.randint(0, 18)):
+            if rng.random() < 0.15:
+                add(0, rng.choice([DIR_TO, DIR_FROM]), FlowGenerator.TCP_ACK)
+            else:
+                add(FlowGenerator.packet_size(bs, ms, etm, rng.randint(1, 1400)), rng.choice([DIR_TO, DIR_FROM]))
+
+        return lengths[:FlowData.PPI_MAX_LEN], directions[:FlowData.PPI_MAX_LEN], flags[:FlowData.PPI_MAX_LEN]
+
+    #--------------------------------------------------------------------------------------------
+    def flow(self):
+        """
+        Generate one flow record.
+
+        Returns:
+            dictionary with flow record fields
+        """
+
+        rng = self.rng
+        lengths, directions, flags = self.packets()
+
+        start = rng.random() * 1e6
+        times = []
+        t = start
+        for _ in lengths:
+            t += rng.choice([0.001, 0.01, 0.2, 1.5, 3.0]) * rng.random()
+            times.append(self.time(t))
+
+        ssh = rng.random() < self.ssh_ratio
+        s_hist = [rng.randint(0, 50) for _ in range(FlowData.PHISTS_LEN)]
+        d_hist = [rng.randint(0, 50) for _ in range(FlowData.PHISTS_LEN)]
+        if rng.random() < 0.3:
+            s_hist[-1] = 500
+        if rng.random() < 0.3:
+            d_hist[-1] = 500
+
+        return {
+            "DST_IP": UnirecIPAddr(f"10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}"),
+            "SRC_IP": UnirecIPAddr(f"10.1.0.{rng.randint(1, 254)}"),
+            "BYTES": sum(l for l, d in zip(lengths, directions) if d == DIR_TO) + 40 * len(lengths),
+            "BYTES_REV": sum(l for l, d in zip(lengths, directions) if d == DIR_FROM) + 40 * len(lengths),
+            "LINK_BIT_FIELD": 1,
+            "TIME_FIRST": self.time(start),
+            "TIME_LAST": self.time(t),
+            "PACKETS": max(directions.count(DIR_TO), rng.randint(0, 40)),
+            "PACKETS_REV": max(directions.count(DIR_FROM), rng.randint(0, 40)),
+            "DST_PORT": 22,
+            "SRC_PORT": rng.randint(1024, 65535),
+            "IDP_CONTENT": bytearray(b"SSH-2.0-OpenSSH_8.9\r\n" if ssh else b"GET / HTTP/1.1\r\n"),
+            "IDP_CONTENT_REV": bytearray(b"SSH-2.0-OpenSSH_9.3\r\n" if ssh else b"HTTP/1.1 200 OK\r\n"),
+            "PPI_PKT_DIRECTIONS": directions,
+            "PPI_PKT_FLAGS": flags,
+            "PPI_PKT_LENGTHS": lengths,
+            "PPI_PKT_TIMES": times,
+            "D_PHISTS_IPT": [0] * FlowData.PHISTS_LEN,
+            "D_PHISTS_SIZES": d_hist,
+            "S_PHISTS_IPT": [0] * FlowData.PHISTS_LEN,
+            "S_PHISTS_SIZES": s_hist,
+        }
+
+    #--------------------------------------------------------------------------------------------
+    def batch(self, count):
+        """
+        Generate list of count flow records (recvBulk result).
+        """
+
+        return [self.flow() for _ in range(count)]
+
+    #--------------------------------------------------------------------------------------------
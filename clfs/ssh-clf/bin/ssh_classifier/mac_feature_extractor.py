@@ -0,0 +1,153 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import numpy as np
+import packet_kernels
+
+
+#------------------------------------------------------------------------------------------------
+class MacFeatureExtractor():
+    """
+    Batch feature extractor for ML predicting ciphersuite (MAC) category.
+    Computes the same features as the former per-flow get_mac_features (kept as reference in tests/test_mac_features.py), but for all flows in FlowData at once.
+    Validity of every packet length for every category is precomputed in a bitmask table indexed by packet length, so the category checks of a flow are a table gather and a bitwise AND reduction over its packet lengths.
+    """
+
+    #Feature columns in order expected by ML model
+    FEATURES = ['ssh-userauth', 'bs8',
+                '16+8n', '20+8n', '24+8n', '28+8n', '32+8n', '40+8n', '44+8n', '72+8n', '76+8n',
+                '24+16n', '28+16n', '32+16n', '36+16n', '40+16n', '48+16n', '52+16n', '80+16n', '84+16n']
+
+    #Category checks (block size, MAC size, min packet size, EtM mode, parent category), parent is always listed before its children
+    #categories are included in each other - category is checked only if parent category is valid
+    CATEGORIES = {
+        '16+8n': (8, 8, 16, False, None),
+        '24+8n': (8, 16, 24, False, '16+8n'),
+        '32+8n': (8, 20, 32, True, '24+8n'),
+        '40+8n': (8, 32, 40, False, '32+8n'),
+        '72+8n': (8, 64, 72, False, '40+8n'),
+        '80+16n': (16, 64, 80, False, '72+8n'),
+        '40+16n': (16, 20, 40, True, '40+8n'),
+        '48+16n': (16, 32, 48, False, '40+8n'),
+        '32+16n': (16, 16, 32, False, '32+8n'),
+        '24+16n': (16, 8, 24, False, '16+8n'),
+        '20+8n': (8, 12, 20, False, None),    #checked only if 16+8n is not valid
+        '28+8n': (8, 20, 28, False, '20+8n'),
+        '44+8n': (8, 32, 44, True, '28+8n'),
+        '76+8n': (8, 64, 76, True, '44+8n'),
+        '84+16n': (16, 64, 84, True, '76+8n'),
+        '52+16n': (16, 32, 52, True, '44+8n'),
+        '28+16n': (16, 12, 28, False, '28+8n'),
+        '36+16n': (16, 20, 36, False, '28+8n'),
+    }
+
+    #Packet lengths are uint16, longer (merged) packets are mapped to the table end with the same residue (all category min sizes are far below)
+    TABLE_SIZE = 1 << 16
+    TABLE_PERIOD = 16
+
+    #--------------------------------------------------------------------------------------------
+    def __init__(self):
+        self.category_table = MacFeatureExtractor.build_category_table()
+        self.all_categories = np.uint32((1 << len(MacFeatureExtractor.CATEGORIES)) - 1)
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def is_in_category(lengths, valid, bs, ms, min_size, mac_etm = False):
+        """
+        Batch version of is_in_category. Check if all valid packet sizes of each flow are valid for the given ciphersuite parameters.
+
+        - lengths:  numpy array (N x PPI_MAX_LEN) with packet lengths
+        - valid:    boolean numpy array (N x PPI_MAX_LEN) with checked packets
+        - bs:       block size
+        - ms:       mac size
+        - min_size: minimum packet size
+        - mac_etm:  MAC EtM mode (bool)
+
+        Returns:
+            boolean numpy array (N)
+        """
+
+        #EtM mode does not encrypt MAC tag AND MESSAGE LENGTH (4B) so the message is padded to cipher block size differently.
+        etm = 4 if mac_etm else 0
+        return (((lengths - ms - etm) % bs == 0) & (lengths >= min_size) | ~valid).all(axis=1)
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def build_category_table():
+        """
+        Precompute bitmask table of valid categories for every packet length. Bit i is set if the packet length is valid for i-th category in CATEGORIES.
+
+        Returns:
+            numpy array (TABLE_SIZE) of uint32 bitmasks
+        """
+
+        lengths = np.arange(MacFeatureExtractor.TABLE_SIZE)[:, None]
+        table = np.zeros(MacFeatureExtractor.TABLE_SIZE, dtype=np.uint32)
+        for bit, (bs, ms, min_size, mac_etm, _) in enumerate(MacFeatureExtractor.CATEGORIES.values()):
+            valid = MacFeatureExtractor.is_in_category(lengths, np.ones_like(lengths, dtype=bool), bs, ms, min_size, mac_etm)
+            table |= valid.astype(np.uint32) << np.uint32(bit)
+        return table
+
+    #--------------------------------------------------------------------------------------------
+    def get_categories(self, lengths, valid):
+        """
+        Get bitmask of categories valid for all checked packets of each flow.
+
+        - lengths:  numpy array (N x PPI_MAX_LEN) with packet lengths
+        - valid:    boolean numpy array (N x PPI_MAX_LEN) with checked packets
+
+        Returns:
+            numpy array (N) of uint32 bitmasks, bit order as in CATEGORIES
+        """
+
+        size, period = MacFeatureExtractor.TABLE_SIZE, MacFeatureExtractor.TABLE_PERIOD
+        index = np.where(lengths < size, lengths, size - period + lengths % period)
+        return np.bitwise_and.reduce(np.where(valid, self.category_table[index], self.all_categories), axis=1)
+
+    #--------------------------------------------------------------------------------------------
+    def extract(self, records):
+        """
+        Extract features for ML to predict ciphersuite category for all flows.
+
+        - records: FlowData with multiple flow records
+
+        Returns:
+            numpy array (N x len(FEATURES)) with feature columns in FEATURES order
+        """
+
+        lengths = records.ppi_lengths
+        counts = records.packet_count.to_numpy()
+        auth_start = records.auth_start.to_numpy()
+        columns = np.arange(lengths.shape[1])
+        rows = np.arange(records.len())
+        features = {}
+
+        #ssh-userauth - SSH_MSG_SERVICE_REQUEST
+        has_userauth = (auth_start > 0) & (auth_start < counts - 1)
+        features['ssh-userauth'] = np.where(has_userauth, lengths[rows, np.where(has_userauth, auth_start, 0)], 0)
+
+        #bs8 - uniq packet sizes after packet 16 differ by 8 but not by 16 (could leak 8B block size info)
+        after_start = (columns >= auth_start[:, None]) & (columns < counts[:, None]) & ((auth_start > 0) & (auth_start < counts))[:, None]
+        residues = np.zeros((records.len(), 16), dtype=bool)
+        residues[np.nonzero(after_start)[0], lengths[after_start] % 16] = True
+        features['bs8'] = (residues[:, :8] & residues[:, 8:]).any(axis=1)
+
+        #possible categories based on packet lenghts from 16B packet
+        pckt_16_index = records.pckt_16_index.to_numpy()
+        if packet_kernels.COMPILED:
+            categories = packet_kernels.category_masks(lengths, pckt_16_index, counts, self.category_table, self.all_categories, MacFeatureExtractor.TABLE_PERIOD)
+        else:
+            after_16 = (columns >= pckt_16_index[:, None]) & (columns < counts[:, None])
+            categories = self.get_categories(lengths, after_16)
+        for bit, (name, (_, _, _, _, parent)) in enumerate(MacFeatureExtractor.CATEGORIES.items()):
+            valid = (categories >> np.uint32(bit)) & 1 == 1
+            if parent is not None:
+                valid &= features[parent]
+            elif name != '16+8n':
+                valid &= ~features['16+8n']
+            features[name] = valid
+
+        return np.column_stack([features[name] for name in MacFeatureExtractor.FEATURES]).astype(np.int64)
+
+    #--------------------------------------------------------------------------------------------
@@ -30,7 +30,7 @@ class MachineLearningModel():
         """
         Generic function to call ML predict on given dataset.
 
-        - data:   pandas data table with given features in columns
+        - data:   numpy matrix (or pandas data table) with given features in columns
         """
 
         return self.model.predict(data)
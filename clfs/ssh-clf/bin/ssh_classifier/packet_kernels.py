@@ -0,0 +1,147 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+"""
+Per-flow packet sequence heuristics written as plain loops over packed (N x PPI_MAX_LEN) arrays.
+Loops are compiled by Numba when it is installed (COMPILED), otherwise the functions run as pure Python. Callers use the kernels only if COMPILED and keep the NumPy vectorized versions (same results) otherwise, pure Python versions serve as readable reference.
+Kernels take only numpy arrays and numbers (no FlowData, sets or enums), so they can be compiled in nopython mode.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+COMPILED = njit is not None
+
+#------------------------------------------------------------------------------------------------
+def jit(function):
+    """
+    Compile the kernel by Numba (nopython, cached) if available.
+    """
+
+    if njit is None:
+        return function
+    return njit(cache=True, nogil=True)(function)
+
+#------------------------------------------------------------------------------------------------
+@jit
+def auth_start_pattern(lengths, directions, counts, userauth_sizes, pattern, init, min_count):
+    """
+    Kernel version of FlowData.auth_start_pattern (same results as FlowData.auth_start_bulk).
+    First position from init matching 'ssh-userauth' request/response pair or the direction pattern, flows with at most min_count packets get 0.
+
+    - lengths:        packed packet lengths
+    - directions:     packed packet directions
+    - counts:         packet count of each flow
+    - userauth_sizes: boolean lookup table of valid 'ssh-userauth' packet sizes indexed by length
+    - pattern:        direction pattern (FlowData.PRE_AUTH_DIR_PATTERN)
+    - init:           first searched position (FlowData.AUTH_INIT_THRESHOLD)
+    - min_count:      minimal packet count (FlowData.SESS_START_MIN)
+
+    Returns:
+        numpy array (N) with guessed auth start positions (0 if not found)
+    """
+
+    result = np.zeros(lengths.shape[0], dtype=np.int64)
+    pattern_len = pattern.shape[0]
+    for row in range(lengths.shape[0]):
+        count = counts[row]
+        if count <= min_count:
+            continue
+
+        for i in range(init, count - pattern_len):
+            length = lengths[row, i]
+            if length == lengths[row, i + 1] and directions[row, i] != directions[row, i + 1] and \
+               length >= 0 and length < userauth_sizes.shape[0] and userauth_sizes[length]:
+                result[row] = i
+                break
+
+            match = True
+            for j in range(pattern_len):
+                if directions[row, i + j] != pattern[j]:
+                    match = False
+                    break
+            if match:
+                result[row] = i
+                break
+    return result
+
+#------------------------------------------------------------------------------------------------
+@jit
+def category_masks(lengths, starts, counts, table, all_categories, period):
+    """
+    Kernel version of chained is_in_category checks (same results as MacFeatureExtractor.get_categories).
+    Bitmask of categories valid for all packets of each flow from the start position.
+
+    - lengths:        packed packet lengths
+    - starts:         first checked packet of each flow (16B packet index)
+    - counts:         packet count of each flow
+    - table:          bitmask table of valid categories indexed by packet length (MacFeatureExtractor.build_category_table)
+    - all_categories: bitmask with all categories
+    - period:         residue period of lengths beyond the table (MacFeatureExtractor.TABLE_PERIOD)
+
+    Returns:
+        numpy array (N) of uint32 bitmasks
+    """
+
+    size = table.shape[0]
+    result = np.empty(lengths.shape[0], dtype=np.uint32)
+    for row in range(lengths.shape[0]):
+        mask = all_categories
+        for i in range(max(starts[row], 0), min(counts[row], lengths.shape[1])):
+            length = lengths[row, i]
+            mask &= table[length if length < size else size - period + length % period]
+        result[row] = mask
+    return result
+
+#------------------------------------------------------------------------------------------------
+@jit
+def repeating(lengths, directions, counts, auth_starts, success_sizes, min_after, size_diff, dir_from):
+    """
+    Kernel version of AuthenticationDetector.detect_repeating.
+    Server responses from auth_start + 2 are summed until a packet not larger than SSH_MSG_USERAUTH_SUCCESS is found.
+
+    - lengths:       packed packet lengths
+    - directions:    packed packet directions
+    - counts:        packet count of each flow
+    - auth_starts:   auth_start of each flow
+    - success_sizes: expected SSH_MSG_USERAUTH_SUCCESS packet size of each flow
+    - min_after:     AuthenticationDetector.MIN_PCKT_AFTER_AUTH
+    - size_diff:     AuthenticationDetector.AUTH_RESPONSE_SIZE_DIFF
+    - dir_from:      server to client direction
+
+    Returns:
+        numpy array (N) of int8 codes: 0 unknown, 1 fail, 2 success
+    """
+
+    codes = np.zeros(lengths.shape[0], dtype=np.int8)
+    for row in range(lengths.shape[0]):
+        count = counts[row]
+        i = auth_starts[row] + 2    #skip 2x SERVICE_REQUEST
+        sum_dst = 0
+        cnt_dst = 0
+        max_dst = 0
+        min_dst = 0
+        while i < count and lengths[row, i] > success_sizes[row]:
+            if directions[row, i] == dir_from:
+                length = lengths[row, i]
+                sum_dst += length
+                cnt_dst += 1
+                max_dst = max_dst if max_dst > length else length
+                min_dst = min_dst if min_dst < length else length
+            i += 1
+
+        #cycle stoped before list end, (small packet was found -> probably authenticated)
+        if i < count - min_after:
+            codes[row] = 2
+        elif cnt_dst > 0:
+            average = sum_dst / cnt_dst
+            if max_dst - average < sum_dst * size_diff or average - min_dst < sum_dst * size_diff:
+                codes[row] = 1
+    return codes
+
+#------------------------------------------------------------------------------------------------
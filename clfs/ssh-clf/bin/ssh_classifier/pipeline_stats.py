@@ -0,0 +1,227 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import numpy as np
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+#------------------------------------------------------------------------------------------------
+class PipelineStats():
+    """
+    Per-stage latency and throughput counters of SSHClassifier.
+    Stages are measured by stage() context manager, flow counters by count() and end-to-end batch latency by batch_done(). Collected values are reported as a periodic stats line (stderr) and as JSON snapshot written to a file and/or sent to a UNIX datagram socket.
+    """
+
+    #Number of last batches used for latency percentiles
+    LATENCY_WINDOW = 1000
+    COUNTERS = ['batches', 'flows_in', 'flows_ssh', 'flows_out']
+
+    #--------------------------------------------------------------------------------------------
+    def __init__(self, interval = 0, stats_file = None, stats_socket = None):
+        """
+        Initialize empty statistics.
+
+        - interval:     period of the stats report in seconds, 0 disables periodic report
+        - stats_file:   path of the JSON snapshot file (rewritten on every report)
+        - stats_socket: path of the UNIX datagram socket receiving JSON snapshots
+        """
+
+        self.interval = interval
+        self.stats_file = stats_file
+        self.stats_socket = stats_socket
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.stages = {}    #stage name -> [count, total seconds]
+        self.counters = dict.fromkeys(PipelineStats.COUNTERS, 0)
+        self.gauges = {}
+        self.latencies = deque(maxlen = PipelineStats.LATENCY_WINDOW)
+        self.started = self.last_report = time.monotonic()
+        self.last_flows = 0
+        self.stopped = threading.Event()
+        self.reporter = None
+
+    #--------------------------------------------------------------------------------------------
+    @contextmanager
+    def stage(self, name):
+        """
+        Measure duration of the enclosed block as the given stage.
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    #--------------------------------------------------------------------------------------------
+    def add_time(self, name, seconds, count = 1):
+        """
+        Add measured duration to the given stage.
+        """
+
+        with self.lock:
+            stage = self.stages.setdefault(name, [0, 0.0])
+            stage[0] += count
+            stage[1] += seconds
+
+    #--------------------------------------------------------------------------------------------
+    def merge(self, stages, counters):
+        """
+        Add stage durations and counters measured by other PipelineStats object (e.g. in a worker process).
+
+        - stages:   dict stage name -> [count, total seconds]
+        - counters: dict counter name -> value
+        """
+
+        for name, (count, seconds) in stages.items():
+            self.add_time(name, seconds, count)
+        for name, value in counters.items():
+            self.count(name, value)
+
+    #--------------------------------------------------------------------------------------------
+    def count(self, name, value = 1):
+        """
+        Increase the given counter (COUNTERS are always reported, other counters since the first increase).
+        """
+
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    #--------------------------------------------------------------------------------------------
+    def batch_done(self, received, flows):
+        """
+        Account exported batch.
+
+        - received: time.monotonic() of the batch reception
+        - flows:    number of exported flows
+
+        Returns:
+            batch latency in seconds
+        """
+
+        latency = time.monotonic() - received
+        with self.lock:
+            self.counters['batches'] += 1
+            self.counters['flows_out'] += flows
+            self.latencies.append(latency)
+        return latency
+
+    #--------------------------------------------------------------------------------------------
+    def set_gauge(self, name, value):
+        """
+        Set current value of a setting or state reported in stats (e.g. adaptive recvBulk settings).
+        """
+
+        with self.lock:
+            self.gauges[name] = value
+
+    #--------------------------------------------------------------------------------------------
+    def snapshot(self):
+        """
+        Get current values of all statistics.
+
+        Returns:
+            dict with JSON serializable statistics
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            latencies = np.array(self.latencies) * 1000
+            snapshot = {
+                'timestamp': time.time(),
+                'uptime': now - self.started,
+                'counters': dict(self.counters),
+                'flows_per_second': (self.counters['flows_out'] - self.last_flows) / max(now - self.last_report, 1e-9),
+                'latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) > 0 else None,
+                'latency_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) > 0 else None,
+                'queue_depth': {name: q.qsize() for name, q in self.queues.items()},
+                'gauges': dict(self.gauges),
+                'stages': {name: {'count': count, 'total': seconds, 'mean_ms': seconds / count * 1000} for name, (count, seconds) in self.stages.items()},
+            }
+            self.last_report = now
+            self.last_flows = self.counters['flows_out']
+        return snapshot
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def format(snapshot):
+        """
+        Format snapshot as a single stats line.
+        """
+
+        counters = snapshot['counters']
+        line = f"stats: batches {counters['batches']}, flows in {counters['flows_in']} ssh {counters['flows_ssh']} out {counters['flows_out']}, {snapshot['flows_per_second']:.1f} flows/s"
+        if counters.get('mac_cache_hits', 0) + counters.get('mac_cache_misses', 0) > 0:
+            line += f", mac cache hits {counters['mac_cache_hits'] / (counters['mac_cache_hits'] + counters['mac_cache_misses']) * 100:.1f} %"
+        if counters.get('batches_unbuffered', 0) > 0:
+            line += f", unbuffered batches {counters['batches_unbuffered']}"
+        if snapshot['latency_p50_ms'] is not None:
+            line += f", latency p50 {snapshot['latency_p50_ms']:.1f} ms p99 {snapshot['latency_p99_ms']:.1f} ms"
+        line += ''.join(f", queue {name} {depth}" for name, depth in snapshot['queue_depth'].items())
+        line += ''.join(f", {name} {value}" for name, value in snapshot['gauges'].items())
+        line += ', stages ' + ' '.join(f"{name} {stage['mean_ms']:.2f}" for name, stage in snapshot['stages'].items()) + ' ms/batch'
+        return line
+
+    #--------------------------------------------------------------------------------------------
+    def report(self):
+        """
+        Print stats line and dump JSON snapshot to the configured file/socket.
+        """
+
+        snapshot = self.snapshot()
+        print(PipelineStats.format(snapshot), file=sys.stderr)
+
+        dump = json.dumps(snapshot)
+        if self.stats_file is not None:
+            #write whole snapshot at once, readers never see partial file
+            tmp = self.stats_file + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write(dump)
+            os.replace(tmp, self.stats_file)
+        if self.stats_socket is not None:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
+                    s.sendto(dump.encode(), self.stats_socket)
+            except OSError:
+                #nobody is listening
+                pass
+
+    #--------------------------------------------------------------------------------------------
+    def start(self):
+        """
+        Start the thread reporting statistics every interval (also while the input is idle), nothing if periodic report is disabled.
+        """
+
+        if self.interval > 0:
+            self.reporter = threading.Thread(target=self.run, daemon=True)
+            self.reporter.start()
+
+    #--------------------------------------------------------------------------------------------
+    def run(self):
+        """
+        Reporter thread loop, runs until stop() is called.
+        """
+
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    #--------------------------------------------------------------------------------------------
+    def stop(self):
+        """
+        Stop the reporter thread.
+        """
+
+        self.stopped.set()
+        if self.reporter is not None:
+            self.reporter.join()
+            self.reporter = None
+
+    #--------------------------------------------------------------------------------------------
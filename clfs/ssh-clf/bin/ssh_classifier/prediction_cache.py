@@ -0,0 +1,94 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import numpy as np
+from collections import OrderedDict
+from mac_feature_extractor import MacFeatureExtractor
+
+
+#------------------------------------------------------------------------------------------------
+class PredictionCache():
+    """
+    Bounded LRU cache of MAC category predictions keyed by feature signature.
+    Flows of the same client/server software share the same feature vector, so the ML model is called only for signatures missing in the cache (each of them once per batch).
+    Signature packs the feature vector (MacFeatureExtractor.FEATURES order) into one integer: 'ssh-userauth' packet size in high bits and one bit for each of the other (boolean) features.
+    """
+
+    #--------------------------------------------------------------------------------------------
+    def __init__(self, model, max_size = 4096):
+        """
+        - model:    ML model with predict function
+        - max_size: maximal number of cached signatures
+        """
+
+        self.model = model
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.weights = np.left_shift(np.int64(1), np.arange(len(MacFeatureExtractor.FEATURES) - 1, dtype=np.int64))
+
+    #--------------------------------------------------------------------------------------------
+    def signature(self, features):
+        """
+        Pack feature vectors into integer signatures.
+
+        - features: numpy array (N x len(FEATURES)) from MacFeatureExtractor.extract
+
+        Returns:
+            numpy array (N) of int64 signatures
+        """
+
+        return (features[:, 0].astype(np.int64) << np.int64(len(self.weights))) | (features[:, 1:].astype(np.int64) @ self.weights)
+
+    #--------------------------------------------------------------------------------------------
+    def predict(self, features, stats = None):
+        """
+        Predict MAC category of all flows, using cached predictions where possible.
+
+        - features: numpy array (N x len(FEATURES)) from MacFeatureExtractor.extract
+        - stats:    optional PipelineStats counting cache hits and misses (flows)
+
+        Returns:
+            numpy array (N) with predicted categories
+        """
+
+        signatures, index, inverse, counts = np.unique(self.signature(features), return_index=True, return_inverse=True, return_counts=True)
+        predictions = np.empty(len(signatures), dtype=object)
+        missing = []
+        for i, signature in enumerate(signatures.tolist()):
+            if signature in self.cache:
+                self.cache.move_to_end(signature)
+                predictions[i] = self.cache[signature]
+            else:
+                missing.append(i)
+
+        if len(missing) > 0:
+            predictions[missing] = self.model.predict(features[index[missing]])
+            for i in missing:
+                self.cache[int(signatures[i])] = predictions[i]
+            #drop least recently used signatures
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+        misses = int(counts[missing].sum())
+        hits = len(features) - misses
+        self.hits += hits
+        self.misses += misses
+        if stats is not None:
+            stats.count('mac_cache_hits', hits)
+            stats.count('mac_cache_misses', misses)
+
+        return predictions[inverse]
+
+    #--------------------------------------------------------------------------------------------
+    def hit_rate(self):
+        """
+        Ratio of flows predicted from cache.
+        """
+
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    #--------------------------------------------------------------------------------------------
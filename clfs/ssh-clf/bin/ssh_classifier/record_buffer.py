@@ -0,0 +1,86 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import numpy as np
+from itertools import chain
+from flow_data import FlowData
+
+
+#------------------------------------------------------------------------------------------------
+class RecordBuffer():
+    """
+    Preallocated NumPy structured array for per-flow array fields of one batch (PPI_* with fixed width PPI_MAX_LEN, *_PHISTS_SIZES).
+    Array fields are decoded from the recvBulk dictionaries (pytrap has no raw bulk access) into the buffer and FlowData uses views of its fields as packed arrays, so PPI lists are not materialized in pandas. preprocess_bulk compacts the packed arrays in place, so no packed arrays are allocated per batch. Buffer is reused for following batches once the batch is exported (SSHClassifier keeps pool of free buffers).
+    Batch with a flow longer than PPI_MAX_LEN does not fit, it is processed with list columns (counted as batches_unbuffered in PipelineStats).
+    """
+
+    #packed array name -> (Unirec field, dtype, width)
+    PPI_FIELDS = {
+        'ppi_lengths': ("PPI_PKT_LENGTHS", np.int32, FlowData.PPI_MAX_LEN),
+        'ppi_directions': ("PPI_PKT_DIRECTIONS", np.int8, FlowData.PPI_MAX_LEN),
+        'ppi_flags': ("PPI_PKT_FLAGS", np.uint8, FlowData.PPI_MAX_LEN),
+        'ppi_times': ("PPI_PKT_TIMES", np.float64, FlowData.PPI_MAX_LEN),
+    }
+    PHISTS_FIELDS = {
+        's_phists_sizes': ("S_PHISTS_SIZES", np.uint32, FlowData.PHISTS_LEN),
+        'd_phists_sizes': ("D_PHISTS_SIZES", np.uint32, FlowData.PHISTS_LEN),
+    }
+
+    #--------------------------------------------------------------------------------------------
+    def __init__(self, capacity = 10000):
+        """
+        - capacity: initial number of flows, buffer grows if a larger batch is received
+        """
+
+        self.dtype = RecordBuffer.record_dtype()
+        self.buffer = np.zeros(max(capacity, 1), dtype=self.dtype)
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def record_dtype():
+        """
+        Returns:
+            numpy structured dtype of one flow (packed array fields and packet_count)
+        """
+
+        return np.dtype([(name, dtype, (width,)) for name, (_, dtype, width) in {**RecordBuffer.PPI_FIELDS, **RecordBuffer.PHISTS_FIELDS}.items()] + [('packet_count', np.int64)])
+
+    #--------------------------------------------------------------------------------------------
+    def fill(self, records):
+        """
+        Decode array fields of the given flow records into the buffer (values are read from the per-flow lists of the records).
+
+        Args:
+            records: list of dictionaries (recvBulk result)
+
+        Returns:
+            dict of packed arrays (views of the buffer) including packet_count, None if some flow has more packets than PPI_MAX_LEN (not supported by fixed width)
+        """
+
+        count = len(records)
+        counts = np.fromiter((len(record["PPI_PKT_LENGTHS"]) for record in records), dtype=np.int64, count=count)
+        if counts.max(initial=0) > FlowData.PPI_MAX_LEN:
+            return None
+        if count > len(self.buffer):
+            self.buffer = np.zeros(count, dtype=self.dtype)
+
+        buffer = self.buffer[:count]
+        #padding has to be zero, as in FlowData.pack
+        buffer[...] = 0
+        buffer['packet_count'] = counts
+
+        valid = np.arange(FlowData.PPI_MAX_LEN) < counts[:, None]
+        total = int(counts.sum())
+        for name, (field, dtype, _) in RecordBuffer.PPI_FIELDS.items():
+            values = chain.from_iterable(record[field] for record in records)
+            if name == 'ppi_times':
+                values = map(lambda t: t.getTimeAsFloat(), values)
+            buffer[name][valid] = np.fromiter(values, dtype=dtype, count=total)
+
+        for name, (field, dtype, width) in RecordBuffer.PHISTS_FIELDS.items():
+            buffer[name] = np.fromiter(chain.from_iterable(record[field] for record in records), dtype=dtype, count=count * width).reshape(count, width)
+
+        return {name: buffer[name] for name in self.dtype.names}
+
+    #--------------------------------------------------------------------------------------------
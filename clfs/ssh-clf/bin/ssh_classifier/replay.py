@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import argparse
+import threading
+from collections import Counter
+
+from ssh_classifier import SSHClassifier
+from batch_recorder import BatchRecorder
+
+
+#------------------------------------------------------------------------------------------------
+class StackSampler():
+    """
+    Simple sampling profiler of one thread. Stack of the thread is sampled periodically by a background thread, functions are counted as leaf (self) and anywhere in the stack (total).
+    Samples are taken only while enabled (same interface as cProfile.Profile), so batch loading and pacing are not included.
+    """
+
+    def __init__(self, interval = 0.005):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples = 0
+        self.leaf = Counter()
+        self.total = Counter()
+        self.running = False
+        self.active = False
+        self.sampler = None
+
+    def start(self):
+        self.running = True
+        self.sampler = threading.Thread(target=self.run, daemon=True)
+        self.sampler.start()
+
+    def stop(self):
+        self.running = False
+        self.sampler.join()
+
+    def enable(self):
+        self.active = True
+
+    def disable(self):
+        self.active = False
+
+    def run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id) if self.active else None
+            if frame is not None:
+                self.samples += 1
+                self.leaf[StackSampler.name(frame)] += 1
+                functions = set()
+                while frame is not None:
+                    functions.add(StackSampler.name(frame))
+                    frame = frame.f_back
+                self.total.update(functions)
+            time.sleep(self.interval)
+
+    @staticmethod
+    def name(frame):
+        code = frame.f_code
+        return f'{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})'
+
+    def report(self, limit, file = sys.stdout):
+        print(f'{self.samples} samples every {self.interval * 1000:.1f} ms', file=file)
+        for title, counter in (('self', self.leaf), ('total', self.total)):
+            print(f'top {limit} by {title}:', file=file)
+            for name, count in counter.most_common(limit):
+                print(f'  {count / max(self.samples, 1) * 100:6.1f} %  {name}', file=file)
+
+#------------------------------------------------------------------------------------------------
+def replay(classifier, paths, speed, repeat, profiler = None):
+    """
+    Feed stored batches into do_detection.
+
+    - classifier: SSHClassifier
+    - paths:      stored batch files (BatchRecorder)
+    - speed:      replay pace relative to the capture (1 is real time), 0 replays at maximum speed
+    - repeat:     number of passes over the batches
+    - profiler:   optional cProfile.Profile (or StackSampler) enabled only during detection
+
+    Returns:
+        tuple (processed flows, seconds spent in detection)
+    """
+
+    flows = 0
+    elapsed = 0.0
+    start = time.monotonic()
+    for _ in range(repeat):
+        for path in paths:
+            #batches are loaded before the pacing wait and detection measurement
+            records, received = BatchRecorder.load(path)
+            if speed > 0:
+                delay = start + received / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            records.received = time.monotonic()
+
+            begin = time.perf_counter()
+            if profiler is not None:
+                profiler.enable()
+            classifier.do_detection(records)
+            if profiler is not None:
+                profiler.disable()
+            elapsed += time.perf_counter() - begin
+            classifier.stats.batch_done(records.received, records.len())
+            flows += records.len()
+        #next pass continues after the last batch of the capture
+        start = time.monotonic()
+
+    return flows, elapsed
+
+#------------------------------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(prog='SSH classifier replay', description='Replay of SSH flow batches captured by ssh_classifier --capture_dir into detection, for reproducible profiling.')
+    parser.add_argument('capture_dir', help='Directory with captured batches')
+    parser.add_argument('--mac-classifier-path', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ssh-mac-classifier.pkl'), help='Path to the python pkl object with MAC classifier')
+    parser.add_argument('--speed', default=0, type=float, help='Replay pace relative to the capture (1 is real time), 0 replays at maximum speed')
+    parser.add_argument('--repeat', default=1, type=int, help='Number of passes over the captured batches')
+    parser.add_argument('--flat_model', action='store_true', help='Predict MAC category by flattened tree ensemble instead of scikit-learn')
+    parser.add_argument('--mac_cache_size', default=0, type=int, help='Max number of cached MAC category predictions (e.g. 4096), 0 disables the cache')
+    parser.add_argument('--scan_fast_path', action='store_true', help='Mark flows which cannot contain authentication as failed without MAC prediction and detectors')
+    parser.add_argument('--profile', default=None, choices=['cprofile', 'sample'], help='Profile detection by cProfile or by sampling the stack of the replay thread')
+    parser.add_argument('--profile_output', default=None, help='File for cProfile stats (pstats format), report is printed if not set')
+    parser.add_argument('--sample_interval', default=0.005, type=float, help='Sampling period of the sampling profiler in seconds')
+    parser.add_argument('--top', default=25, type=int, help='Number of functions in the profile report')
+    args = parser.parse_args()
+
+    paths = BatchRecorder.paths(args.capture_dir)
+    if len(paths) == 0:
+        raise Exception(f'No captured batches in {args.capture_dir}.')
+
+    classifier = SSHClassifier(args.mac_classifier_path, flat_model = args.flat_model, mac_cache_size = args.mac_cache_size, scan_fast_path = args.scan_fast_path)
+
+    profiler = cProfile.Profile() if args.profile == 'cprofile' else None
+    sampler = StackSampler(args.sample_interval) if args.profile == 'sample' else None
+    if sampler is not None:
+        sampler.start()
+    flows, elapsed = replay(classifier, paths, args.speed, args.repeat, profiler if profiler is not None else sampler)
+    if sampler is not None:
+        sampler.stop()
+
+    stats = classifier.stats.snapshot()
+    print(f"flows {flows} in {len(paths) * args.repeat} batches, detection {elapsed:.3f} s, {flows / elapsed if elapsed > 0 else 0:.0f} flows/s")
+    for name, stage in stats['stages'].items():
+        print(f"  {name:<16} {stage['total']:8.3f} s {stage['total'] / elapsed * 100 if elapsed > 0 else 0:6.1f} %")
+
+    if profiler is not None:
+        if args.profile_output is not None:
+            profiler.dump_stats(args.profile_output)
+        else:
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(args.top)
+    if sampler is not None:
+        sampler.report(args.top)
+
+#------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    main()
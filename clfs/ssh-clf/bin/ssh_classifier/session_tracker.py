@@ -0,0 +1,146 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import threading
+import pandas as pd
+from collections import OrderedDict
+from flow_data import FlowData
+
+
+#------------------------------------------------------------------------------------------------
+class SessionTracker():
+    """
+    Bounded table of classified SSH connections keyed by flow key.
+    Long SSH sessions split by the exporter (active timeout) come as several flow records and only the first one contains the handshake, so the following records do not pass the SSH filter. Detection results of the first record are remembered and attached to the following records of the same connection without running detection again.
+    Table is kept in least recently used order, sessions idle longer than idle_timeout are evicted first, then the least recently used ones above max_size.
+    Table is accessed by the receiving thread (split) and by the output thread (remember), so access is locked.
+    """
+
+    #flow key of the connection (input flows do not contain protocol, SSH is TCP only), values are compared in text form (pytrap IP address objects do not guarantee hash of equal values)
+    KEY_FIELDS = ['SRC_IP', 'DST_IP', 'SRC_PORT', 'DST_PORT']
+    #values remembered from the first record of the session
+    COLUMNS = ['mac_category', 'result', 'method', 'timing', 'traffic_type', 'auth_start']
+
+    #--------------------------------------------------------------------------------------------
+    def __init__(self, max_size = 100000, idle_timeout = 600):
+        """
+        - max_size:     maximal number of tracked sessions
+        - idle_timeout: seconds since the last record of the session until it is evicted
+        """
+
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.continued = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+
+    #--------------------------------------------------------------------------------------------
+    def len(self):
+        return len(self.sessions)
+
+    #--------------------------------------------------------------------------------------------
+    def split(self, bulk, now, stats = None):
+        """
+        Separate follow-up records of tracked sessions from the received records.
+        Record of a tracked session is a follow-up record only if it does not pass the SSH filter (new handshake with reused ports is classified again).
+
+        - bulk:  list of dictionaries (recvBulk result)
+        - now:   current time (time.monotonic)
+        - stats: optional PipelineStats counting follow-up records
+
+        Returns:
+            tuple (list of other records, list of follow-up records, list of remembered values of follow-up records)
+        """
+
+        if len(self.sessions) == 0:
+            return bulk, [], []
+
+        remaining, continued, values = [], [], []
+        with self.lock:
+            self.evict(now, stats)
+            sessions = self.sessions
+            for record in bulk:
+                key = tuple(str(record[field]) for field in SessionTracker.KEY_FIELDS)
+                session = sessions.get(key)
+                if session is None or FlowData.is_ssh(record):
+                    remaining.append(record)
+                    continue
+
+                session[1] = now
+                sessions.move_to_end(key)
+                continued.append(record)
+                values.append(session[0])
+
+        self.continued += len(continued)
+        if stats is not None:
+            stats.count('flows_continued', len(continued))
+        return remaining, continued, values
+
+    #--------------------------------------------------------------------------------------------
+    def attach(self, records, values, scalar_only = True):
+        """
+        Create FlowData of follow-up records with remembered values of their sessions.
+
+        - records:     list of follow-up records (split result)
+        - values:      list of remembered values (split result)
+        - scalar_only: keep only FlowData.SCALAR_FIELDS of the records (array fields are not needed for export)
+
+        Returns:
+            FlowData with SCALAR_FIELDS (or all record fields) and COLUMNS
+        """
+
+        continued = FlowData([])
+        continued.data = pd.DataFrame(records, columns=FlowData.SCALAR_FIELDS if scalar_only else None)
+        for column, column_values in zip(SessionTracker.COLUMNS, zip(*values)):
+            continued.data[column] = pd.Series(column_values, dtype=object)
+        return continued
+
+    #--------------------------------------------------------------------------------------------
+    def remember(self, records, now, stats = None):
+        """
+        Store detection results of classified records as new sessions (existing sessions are replaced).
+
+        - records: FlowData with detection results
+        - now:     current time (time.monotonic)
+        - stats:   optional PipelineStats with session table size and eviction counters
+        """
+
+        keys = zip(*(records.data[field].astype(str).tolist() for field in SessionTracker.KEY_FIELDS))
+        values = zip(*(getattr(records, column).tolist() for column in SessionTracker.COLUMNS))
+        with self.lock:
+            sessions = self.sessions
+            for key, value in zip(keys, values):
+                sessions[key] = [value, now]
+                sessions.move_to_end(key)
+            self.evict(now, stats)
+
+        if stats is not None:
+            stats.set_gauge('sessions', len(self.sessions))
+
+    #--------------------------------------------------------------------------------------------
+    def evict(self, now, stats = None):
+        """
+        Drop idle sessions and the least recently used sessions above max_size (lock has to be held).
+        """
+
+        sessions = self.sessions
+        idle = 0
+        #sessions are ordered by the last access (reception or export time), idle ones are at the beginning
+        while len(sessions) > 0 and now - next(iter(sessions.values()))[1] > self.idle_timeout:
+            sessions.popitem(last=False)
+            idle += 1
+
+        lru = max(0, len(sessions) - self.max_size)
+        for _ in range(lru):
+            sessions.popitem(last=False)
+
+        self.evicted_idle += idle
+        self.evicted_lru += lru
+        if stats is not None:
+            stats.count('sessions_evicted_idle', idle)
+            stats.count('sessions_evicted_lru', lru)
+
+    #--------------------------------------------------------------------------------------------
@@ -0,0 +1,128 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import numpy as np
+import multiprocessing
+from multiprocessing import shared_memory
+from record_buffer import RecordBuffer
+
+
+#------------------------------------------------------------------------------------------------
+class ShardPool():
+    """
+    Pool of shard worker processes receiving packed flow arrays through shared memory.
+    Every shard owns a ring of slots in its own shared memory block, each slot is a RecordBuffer structured array (capacity flows). Ingest process copies rows of a shard into a free slot and sends only the slot index to the worker, the worker calls handler on views of the slot and returns the slot once the handler finishes. Submit blocks while all slots of the shard are in use (backpressure).
+    Results of all shards are sent to a single result queue as tuples (kind, key, payload):
+        ('result', key, handler result), ('error', key, error message), ('done', shard, None) when the worker stops.
+    Workers are forked, so they inherit the handler state (e.g. loaded ML model) of the ingest process.
+    """
+
+    SLOTS = 4
+
+    #--------------------------------------------------------------------------------------------
+    def __init__(self, handler, shards, capacity, slots = SLOTS):
+        """
+        - handler:  function called in the worker with dict of packed arrays (RecordBuffer fields), its result has to be picklable
+        - shards:   number of worker processes
+        - capacity: max number of flows in one slot
+        - slots:    number of slots of every shard
+        """
+
+        if shards < 1 or capacity < 1 or slots < 1:
+            raise Exception(f'Invalid shard pool size: shards {shards}, capacity {capacity}, slots {slots}.')
+
+        context = multiprocessing.get_context('fork')
+        self.handler = handler
+        self.shards = shards
+        self.capacity = capacity
+        self.dtype = RecordBuffer.record_dtype()
+        self.memory = []
+        self.slots = []
+        self.free = []
+        self.tasks = []
+        self.results = context.Queue()
+        for _ in range(shards):
+            memory = shared_memory.SharedMemory(create=True, size=slots * capacity * self.dtype.itemsize)
+            self.memory.append(memory)
+            self.slots.append(np.ndarray((slots, capacity), dtype=self.dtype, buffer=memory.buf))
+            free = context.Queue()
+            for slot in range(slots):
+                free.put(slot)
+            self.free.append(free)
+            self.tasks.append(context.Queue())
+
+        self.workers = [context.Process(target=self.worker, args=(shard,), daemon=True) for shard in range(shards)]
+        for worker in self.workers:
+            worker.start()
+
+    #--------------------------------------------------------------------------------------------
+    def submit(self, shard, key, arrays, rows):
+        """
+        Copy selected flows into a free slot of the shard and hand it to the shard worker.
+
+        - shard:  shard index
+        - key:    identification of the part returned with the result
+        - arrays: dict of packed arrays (all RecordBuffer fields, one flow per row)
+        - rows:   indices of flows sent to the shard (at most capacity)
+        """
+
+        count = len(rows)
+        if count > self.capacity:
+            raise Exception(f'Shard part of {count} flows exceeds slot capacity {self.capacity}.')
+
+        slot = self.free[shard].get()
+        buffer = self.slots[shard][slot]
+        for name in self.dtype.names:
+            np.take(arrays[name], rows, axis=0, out=buffer[name][:count])
+        self.tasks[shard].put((key, slot, count))
+
+    #--------------------------------------------------------------------------------------------
+    def worker(self, shard):
+        """
+        Shard worker process loop, runs until the stop mark (None) is received.
+        """
+
+        slots = self.slots[shard]
+        while True:
+            task = self.tasks[shard].get()
+            if task is None:
+                break
+
+            key, slot, count = task
+            try:
+                result = self.handler({name: slots[slot][name][:count] for name in self.dtype.names})
+                self.results.put(('result', key, result))
+            except Exception as e:
+                self.results.put(('error', key, f'Shard {shard}: {e!r}'))
+            finally:
+                self.free[shard].put(slot)
+
+        self.results.put(('done', shard, None))
+
+    #--------------------------------------------------------------------------------------------
+    def close(self):
+        """
+        Stop workers after all submitted parts are processed.
+        """
+
+        for tasks in self.tasks:
+            tasks.put(None)
+
+    #--------------------------------------------------------------------------------------------
+    def join(self):
+        """
+        Wait for stopped workers and free shared memory.
+        """
+
+        for worker in self.workers:
+            worker.join()
+
+        #views have to be released before shared memory is closed
+        self.slots = []
+        for memory in self.memory:
+            memory.close()
+            memory.unlink()
+        self.memory = []
+
+    #--------------------------------------------------------------------------------------------
@@ -4,14 +4,16 @@
 # (C) 2023 FIT CTU in Prague, Czech Republic
 # (C) 2023 FIT VUT in Brno, Czech Republic
 
-import pytrap
 import sys
+import time
 import argparse
 import binascii
 import numpy as np
 import pandas as pd
+import zlib
 import queue
 import threading
+import multiprocessing
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 pd.set_option('mode.chained_assignment', None)
@@ -20,7 +22,23 @@ from flow_data import DIR_TO, DIR_FROM, ResultAuth, ResultAuthMethod, ResultAuth
 from traffic_type_detector import TrafficTypeDetector
 from authentication_detector import AuthenticationDetector
 from timing_detector import TimingDetector
+from mac_feature_extractor import MacFeatureExtractor
 from machine_learning_model import MachineLearningModel
+from tree_ensemble_model import TreeEnsembleModel
+from prediction_cache import PredictionCache
+from record_buffer import RecordBuffer
+from batch_controller import BatchController
+from pipeline_stats import PipelineStats
+from shard_pool import ShardPool
+from session_tracker import SessionTracker
+from bruteforce_aggregator import BruteForceAggregator
+from batch_recorder import BatchRecorder
+
+try:
+    import pytrap
+except ImportError:
+    #offline use without NEMEA (benchmark), TRAP context has to be provided by caller
+    pytrap = None
 
 #Traffic directions
 # DIR_TO = 1
@@ -64,6 +82,67 @@ def preprocess(data):
     #         # setattr(data, field, x)
     #         data[field] = x
 
+#------------------------------------------------------------------------------------------------
+def preprocess_bulk(records):
+    """
+    Batch version of preprocess working on packed FlowData arrays. Produces the same result as preprocess applied to every row.
+    Packet with 16 tcp flag is merged (length added) into the following packet if it has the same direction, otherwise its flag is set to 0. Merged packets are removed and remaining packets are shifted to the left (cumulative sum compaction).
+    Packed arrays are compacted in place, so batches decoded into RecordBuffer keep using the buffer.
+
+    - records: FlowData with multiple flow records
+    """
+
+    lengths = records.ppi_lengths
+    directions = records.ppi_directions
+    flags = records.ppi_flags
+    counts = records.packet_count.to_numpy()
+    width = lengths.shape[1]
+    valid = np.arange(width) < counts[:, None]
+
+    ack = flags == 16
+    #following packet exists and has the same direction
+    merge = np.zeros_like(ack)
+    merge[:, :-1] = ack[:, :-1] & valid[:, 1:] & (directions[:, 1:] == directions[:, :-1])
+    keep = valid & ~merge
+
+    #every run of merged packets ends with kept packet, which gets sum of the run lengths
+    merged_sum = np.cumsum(np.where(merge, lengths, 0), axis=1)
+    rows, cols = np.nonzero(keep)
+    new_cols = np.cumsum(keep, axis=1)[rows, cols] - 1
+    run_sum = merged_sum[rows, cols]
+    added = run_sum - np.concatenate(([0], run_sum[:-1]))
+    added[new_cols == 0] = run_sum[new_cols == 0]
+
+    #kept packets are gathered before the arrays are overwritten
+    kept = [(lengths, lengths[rows, cols] + added),
+            (directions, directions[rows, cols]),
+            (flags, np.where(ack[rows, cols], 0, flags[rows, cols]))]   #not merged 16 flag marked as 0
+    #packed times (decoded in RecordBuffer) are moved as directions
+    if 'ppi_times' in records.arrays:
+        times = records.arrays['ppi_times']
+        kept.append((times, times[rows, cols]))
+    for array, values in kept:
+        array[...] = 0
+        array[rows, new_cols] = values
+
+    records.arrays.pop('valid_mask', None)
+    new_counts = keep.sum(axis=1)
+    records.data['packet_count'] = new_counts
+
+    #keep list columns in sync (in place, as preprocess does), only flows containing 16 tcp flag were changed
+    if "PPI_PKT_LENGTHS" not in records.data:
+        return
+    source = np.zeros(lengths.shape, dtype=np.intp)
+    source[rows, new_cols] = cols
+    columns = {field: records.data[field].to_numpy() for field in FILTER_ARRAY_FIELDS}
+    for i in np.flatnonzero(ack.any(axis=1)):
+        n = new_counts[i]
+        columns["PPI_PKT_LENGTHS"][i][:] = lengths[i, :n].tolist()
+        columns["PPI_PKT_FLAGS"][i][:] = flags[i, :n].tolist()
+        for field in ("PPI_PKT_DIRECTIONS", "PPI_PKT_TIMES"):
+            values = columns[field][i]
+            values[:] = [values[j] for j in source[i, :n]]
+
 #------------------------------------------------------------------------------------------------
 def export_result(data, alert, DEBUG, trap):
     """
@@ -98,129 +177,101 @@ def export_result(data, alert, DEBUG, trap):
     trap.send(alert.getData(), 0)
 
 #------------------------------------------------------------------------------------------------
-def get_mac_features(flow):
+#Alert fields copied from the input flow and alert fields filled with names of detector results
+EXPORT_FLOW_FIELDS = ["DST_IP", "SRC_IP", "BYTES", "BYTES_REV", "LINK_BIT_FIELD", "TIME_FIRST", "TIME_LAST", "PACKETS", "PACKETS_REV", "DST_PORT", "SRC_PORT"]
+EXPORT_RESULT_FIELDS = {"result": "AUTHENTICATION_RESULT", "method": "AUTHENTICATION_METHOD", "timing": "AUTHENTICATION_TIMING", "traffic_type": "TRAFFIC_CATEGORY"}
+EXPORT_DEBUG_FIELDS = ["PPI_PKT_DIRECTIONS", "PPI_PKT_FLAGS", "PPI_PKT_LENGTHS", "PPI_PKT_TIMES"]
+
+#------------------------------------------------------------------------------------------------
+def export_bulk(records, alert, DEBUG, trap):
     """
-    Helper function extract features for ML to predict ciphersuite category.
-    Multiple enc/MAC ciphersuite options results in same packet sizes. Instead of focusing to predict the exact algorithm, we split possible combinations into several categories (naming convention: block_size + MAC_size, e.g. 8  + 16). Classifier does not care about the cipher so much (only it's block size). More important is to determine the correct MAC algorithm (respectively it's length), because the appended length is projected into every packet information we have.
-    Function is_in_category have different meaning of categories (using naming min_size+block_size) and is used as a feature for ML. This feature also overlaps (fully nested) and have more exlusionary characteristics, which could not be reflected in the shorter communication.
+    Bulk version of export_result. Send IFC alerts for all flows in FlowData.
+    Values are taken from the columns at once and enum names are looked up once per unique value, so the per flow loop only fills the template and sends it.
 
-    - data: input flows variable
+    - records: FlowData with detection results
+    - alert:   output UniRec template
+    - DEBUG:   export also packet sequences
+    - trap:    TRAP context
     """
 
+    data = records.data
+    columns = {field: data[field].tolist() for field in EXPORT_FLOW_FIELDS}
+    for column, field in EXPORT_RESULT_FIELDS.items():
+        names = {value: value.name for value in data[column].unique()}
+        columns[field] = [names[value] for value in data[column]]
+    if DEBUG == True:
+        for field in EXPORT_DEBUG_FIELDS:
+            columns[field] = data[field].tolist()
 
-    features = {
-    'ssh-userauth': None,
-    'bs8': False,
-    '16+8n': False,
-    '20+8n': False,
-    '24+8n': False,
-    '28+8n': False,
-    '32+8n': False,
-    '40+8n': False,
-    '44+8n': False,
-    '72+8n': False,
-    '76+8n': False,
-    '24+16n': False,
-    '28+16n': False,
-    '32+16n': False,
-    '36+16n': False,
-    '40+16n': False,
-    '48+16n': False,
-    '52+16n': False,
-    '80+16n': False,
-    '84+16n': False,
-    # 'no_category': False
-    }
-    #c_ssh-userauth - SSH_MSG_SERVICE_REQUEST
-    features["ssh-userauth"] = flow.PPI_PKT_LENGTHS[flow.auth_start] if flow.auth_start > 0 and flow.auth_start < len(flow.PPI_PKT_LENGTHS)-1 else 0
-
-    #bs8 - check difference between packet sizes (could leak 8B block size info)
-    if flow.auth_start > 0 and flow.auth_start < len(flow.PPI_PKT_LENGTHS):
-        a = list(set(flow.PPI_PKT_LENGTHS[flow.auth_start:]))  #uniq packet sizes after packet 16
-        for i in range(len(a)):
-            for j in a[i+1:]: #look only forward (behind was check by previous iteration)
-                if (int(a[i]) - int(j)) % 16 and (int(a[i]) - int(j)) % 8 == 0:
-                    features["bs8"] = True
-                    break
-            if features["bs8"]:
-                break
-    else:
-        pass
-
-    # print(is_in_category(8, 8, flow.PPI_PKT_LENGTHS[vals["has16"]+1:], 16))
-    #possible categories based on packet lenghts
-    #- categories are included in each other - no need to check all of them
-    if is_in_category(8, 8, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 16):
-        #16+8n
-        features['16+8n'] = True
-        if is_in_category(8, 16, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 24):
-            features['24+8n'] = True
-            if is_in_category(8, 20, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 32, True):
-                features['32+8n'] = True
-                if is_in_category(8, 32, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 40):
-                    features['40+8n'] = True
-                    if is_in_category(8, 64, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 72):
-                        features['72+8n'] = True
-                        if is_in_category(16, 64, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 80):
-                            features['80+16n'] = True
-                    if is_in_category(16, 20, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 40, True):
-                        features['40+16n'] = True
-                    if is_in_category(16, 32, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 48):
-                        features['48+16n'] = True
-                if is_in_category(16, 16, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 32):
-                    features['32+16n'] = True
-            if is_in_category(16, 8, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 24):
-                features['24+16n'] = True
-
-    elif is_in_category(8, 12, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 20):
-        #20+8n
-        features['20+8n'] = True
-        if is_in_category(8, 20, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 28):
-            features['28+8n'] = True
-            if is_in_category(8, 32, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 44, True):
-                features['44+8n'] = True
-                if is_in_category(8, 64, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 76, True):
-                    features['76+8n'] = True
-                    if is_in_category(16, 64, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 84, True):
-                        features['84+16n'] = True
-                if is_in_category(16, 32, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 52, True):
-                    features['52+16n'] = True
-            if is_in_category(16, 12, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 28):
-                features['28+16n'] = True
-            if is_in_category(16, 20, flow.PPI_PKT_LENGTHS[flow.pckt_16_index:], 36):
-                features['36+16n'] = True
-
-    else:
-        # some iplementatins (e.g. OpenSSH) send 2 SSH messages (e.g. global request not specified by RFC) in the same packet
-        # for MTE MAC it is no problem, but for ETM MAC and chacha-poly you calculate the second size header (4B) in packet size, leading to missmatch all categories
-        # features["no_category"] = True
-        pass
-
-    return pd.Series(features)
+    fields = list(columns)
+    send = trap.send
+    for values in zip(*columns.values()):
+        for field, value in zip(fields, values):
+            setattr(alert, field, value)
+        send(alert.getData(), 0)
+
+#------------------------------------------------------------------------------------------------
+def export_summary(summaries, alert, trap):
+    """
+    Send IFC records with brute-force aggregation summaries (SSHClassifier.PYTRAP_SUMMARY_OUTPUT_SPECIFICATION).
+
+    - summaries: pandas DataFrame from BruteForceAggregator (BruteForceAggregator.SUMMARY_COLUMNS)
+    - alert:     output UniRec template
+    - trap:      TRAP context
+    """
+
+    columns = {field: summaries[field].tolist() for field in BruteForceAggregator.SUMMARY_COLUMNS}
+    if pytrap is not None:
+        #aggregation keys are addresses in text form, per source summaries have no destination
+        columns["SRC_IP"] = [pytrap.UnirecIPAddr(address) for address in columns["SRC_IP"]]
+        columns["DST_IP"] = [pytrap.UnirecIPAddr("0.0.0.0" if address is None else address) for address in columns["DST_IP"]]
+        for field in ("TIME_FIRST", "TIME_LAST"):
+            columns[field] = [pytrap.UnirecTime(value) for value in columns[field]]
+
+    fields = list(columns)
+    send = trap.send
+    for values in zip(*columns.values()):
+        for field, value in zip(fields, values):
+            setattr(alert, field, value)
+        send(alert.getData(), 0)
+
+#------------------------------------------------------------------------------------------------
+#Classifier used by detection workers, inherited from the main process (fork)
+_worker_classifier = None
 
 #------------------------------------------------------------------------------------------------
-def is_in_category(bs, ms, arr, min_size, mac_etm = False):
+def detect_worker(records):
     """
-    Helper function check if the given sequence of packet sizes is valid for the given ciphersuite parameters (block size, MAC size, min packet length, EtM/MtE mode).
+    Detection running in pipeline worker process.
 
+    - records: detached and preprocessed FlowData
 
-    - bs:       block size
-    - ms:       mac size
-    - arr:      packet lengths
-    - min_size: minimum packet size
-    - mac_etm:  MAC EtM mode (bool)
+    Returns:
+        tuple of pandas DataFrame with detection results (SSHClassifier.RESULT_COLUMNS) and stage durations and counters measured in the worker
     """
 
-    etm = 0
-    if mac_etm:
-        #EtM mode does not encrypt MAC tag AND MESSAGE LENGTH (4B) so the message is padded to cipher block size (min 4B padding, block multiple of 8B) differently.
-        etm = 4
-    for i in arr:
-        #cython?
-        #check if every packet (encrypted part) is multiple of the given block size (as required in the RFC)
-        if ((int(i) - ms - etm) % bs == 0) == False or int(i) < min_size:
-            return False
-    return True
+    #stages of each batch are measured separately and merged into main process statistics
+    _worker_classifier.stats = PipelineStats()
+    _worker_classifier.classify(records)
+    return records.data[SSHClassifier.RESULT_COLUMNS], (_worker_classifier.stats.stages, _worker_classifier.stats.counters)
+
+#------------------------------------------------------------------------------------------------
+def classify_shard(arrays):
+    """
+    Detection running in shard worker process (ShardPool handler).
+
+    - arrays: dict of preprocessed packed arrays and packet_count (views of shared memory slot)
+
+    Returns:
+        tuple of dict with detection results (SSHClassifier.RESULT_COLUMNS numpy arrays) and stage durations and counters measured in the worker
+    """
+
+    records = FlowData([])
+    records.data = pd.DataFrame({'packet_count': arrays['packet_count']})
+    records.arrays = {key: arrays[key] for key in FlowData.DETACHED_ARRAYS}
+    _worker_classifier.stats = PipelineStats()
+    _worker_classifier.classify(records)
+    return {column: records.data[column].to_numpy() for column in SSHClassifier.RESULT_COLUMNS}, (_worker_classifier.stats.stages, _worker_classifier.stats.counters)
 
 #------------------------------------------------------------------------------------------------
 class SSHClassifier():
@@ -232,10 +283,26 @@ class SSHClassifier():
     # define required pytrap input/output specication
     SINGLE_IFC_PYTRAP_INPUT_SPECIFICATION = "ipaddr DST_IP,ipaddr SRC_IP,uint64 BYTES,uint64 BYTES_REV,uint64 LINK_BIT_FIELD,time TIME_FIRST,time TIME_LAST,uint32 PACKETS,uint32 PACKETS_REV,uint16 DST_PORT,uint16 SRC_PORT,bytes IDP_CONTENT,bytes IDP_CONTENT_REV,int8* PPI_PKT_DIRECTIONS,uint8* PPI_PKT_FLAGS,uint16* PPI_PKT_LENGTHS,time* PPI_PKT_TIMES,uint32* D_PHISTS_IPT,uint32* D_PHISTS_SIZES,uint32* S_PHISTS_IPT,uint32* S_PHISTS_SIZES"
     PYTRAP_OUTPUT_SPECIFICATION = "ipaddr DST_IP,ipaddr SRC_IP,uint64 BYTES,uint64 BYTES_REV,uint64 LINK_BIT_FIELD,time TIME_FIRST,time TIME_LAST,uint32 PACKETS,uint32 PACKETS_REV,uint16 DST_PORT,uint16 SRC_PORT,string AUTHENTICATION_RESULT,string AUTHENTICATION_METHOD,string AUTHENTICATION_TIMING,string TRAFFIC_CATEGORY"
+    PYTRAP_SUMMARY_OUTPUT_SPECIFICATION = "ipaddr SRC_IP,ipaddr DST_IP,time TIME_FIRST,time TIME_LAST,uint32 FLOWS,uint32 AUTH_FAIL,uint32 AUTH_OK,uint32 AUTH_UNKNOWN,string AGGREGATION"
     PYTRAP_EXTENDED_OUTPUT_SPECIFICATION = "ipaddr DST_IP,ipaddr SRC_IP,uint64 BYTES,uint64 BYTES_REV,uint64 LINK_BIT_FIELD,time TIME_FIRST,time TIME_LAST,uint32 PACKETS,uint32 PACKETS_REV,uint16 DST_PORT,uint16 SRC_PORT,string AUTHENTICATION_RESULT,string AUTHENTICATION_METHOD,string AUTHENTICATION_TIMING,string TRAFFIC_CATEGORY,int8* PPI_PKT_DIRECTIONS,uint8* PPI_PKT_FLAGS,uint16* PPI_PKT_LENGTHS,time* PPI_PKT_TIMES"
 
+    #calculated flow values used by feature extraction and detectors (FlowData.FEATURES)
+    FEATURES = ['packet_count', 'ppi_lengths', 'ppi_directions', 'ppi_times', 'pckt_16_index', 'auth_start', 'auth_end',
+                'hist_src_size_major', 'hist_src_size_perc', 'hist_dst_size_major', 'hist_dst_size_perc']
+
+    #detection results returned by pipeline workers
+    RESULT_COLUMNS = ['mac_category', 'result', 'method', 'timing', 'traffic_type']
+
+    #results of flows which cannot contain authentication (scan fast path), MAC category is not predicted
+    FAST_PATH_RESULTS = {'mac_category': None, 'result': ResultAuth.fail, 'method': ResultAuthMethod.unknown, 'timing': ResultAuthTiming.unknown, 'traffic_type': ResultTrafficType.other}
+
+    #flow key used for sharding, all flows of one connection are processed by the same shard
+    SHARD_KEY_FIELDS = ['SRC_IP', 'DST_IP', 'SRC_PORT', 'DST_PORT']
+
     #--------------------------------------------------------------------------------------------
-    def __init__(self, mac_pkl, stdout = False, debug = False, recv_timeout = 10, recv_messages = 10000, max_queue_size = 10):
+    def __init__(self, mac_pkl, stdout = False, debug = False, recv_timeout = 10, recv_messages = 10000, max_queue_size = 10, workers = 0, ordered = False, stats_interval = 0, stats_file = None, stats_socket = None, flat_model = False, mac_cache_size = 0, latency_slo = 0, shards = 0, session_table_size = 0, session_idle_timeout = 600,
+                 aggregate_window = 0, aggregate_buckets = 12, aggregate_max_keys = 65536, scan_fast_path = False,
+                 capture_dir = None):
         """
         Initialize class and set all given parameters.
 
@@ -246,6 +313,22 @@ class SSHClassifier():
         - recv_timeout:     recvBulk Timeout in seconds before interrupt of capture
         - recv_messages:    recvBulk Maximum number of messages to capture, infinite when -1
         - max_queue_size:   max size of queue used for producer-consumer data handoff
+        - workers:          number of detection worker processes (pipeline mode), 0 runs detection in the consumer thread
+        - ordered:          pipeline mode exports batches in the receiving order
+        - stats_interval:   period of stats report in seconds, 0 disables periodic report
+        - stats_file:       path of JSON stats file rewritten on every report
+        - stats_socket:     path of UNIX datagram socket receiving JSON stats on every report
+        - flat_model:       predict MAC category by flattened tree ensemble (TreeEnsembleModel) instead of sklearn
+        - mac_cache_size:   max number of cached MAC category predictions (PredictionCache), 0 disables the cache
+        - latency_slo:      target flow latency in seconds for adaptive recvBulk size and timeout (BatchController), 0 keeps static recv_messages and recv_timeout
+        - shards:           number of shard worker processes (flows partitioned by flow key, passed in shared memory), takes precedence over workers, 0 disables sharding
+        - session_table_size:   max number of tracked SSH sessions, results are attached to follow-up flow records of the session (SessionTracker), 0 disables tracking
+        - session_idle_timeout: seconds without any flow record of the session until it is dropped from the session table
+        - aggregate_window:     sliding window in seconds of brute-force aggregation (BruteForceAggregator), summaries are exported instead of flows, 0 disables aggregation
+        - aggregate_buckets:    number of time buckets of the aggregation window
+        - aggregate_max_keys:   max number of aggregation keys (per source and destination pair and per source)
+        - scan_fast_path:       flows which cannot contain authentication (scans, banner grabs) are marked as failed without MAC prediction and detectors
+        - capture_dir:          directory where received SSH flow batches are stored for offline replay (BatchRecorder), None disables capture
         """
 
         #Prepare variable for templates and incomming flows
@@ -253,9 +336,11 @@ class SSHClassifier():
         self.stdout = stdout
         self.debug = debug
         self.data = {}
-        self.trap = pytrap.TrapCtx()
+        self.trap = pytrap.TrapCtx() if pytrap is not None else None
         self.initialized = False
-        self.mac_predictor = MachineLearningModel(mac_pkl)
+        self.mac_predictor = TreeEnsembleModel(mac_pkl) if flat_model else MachineLearningModel(mac_pkl)
+        self.mac_cache = PredictionCache(self.mac_predictor, mac_cache_size) if mac_cache_size > 0 else None
+        self.mac_feature_extractor = MacFeatureExtractor()
         self.timing_detector = TimingDetector()
         self.authentication_detector = AuthenticationDetector(self.mac_predictor)
         self.traffic_type_detector = TrafficTypeDetector()
@@ -263,6 +348,25 @@ class SSHClassifier():
         self.recv_messages = recv_messages
         self.running = True
         self.recordsToProcess = queue.Queue(maxsize = max_queue_size)
+        self.workers = workers
+        self.ordered = ordered
+        self.pool = None
+        self.recordsToExport = queue.Queue()
+        self.inFlight = threading.BoundedSemaphore(max_queue_size)
+        self.stats = PipelineStats(stats_interval, stats_file, stats_socket)
+        self.stats.queues = {'process': self.recordsToProcess, 'export': self.recordsToExport}
+        #reusable buffers for array fields of received batches, lists are needed for debug and stdout output
+        self.use_buffers = not debug and not stdout
+        self.freeBuffers = queue.Queue()
+        self.controller = BatchController(latency_slo, int(recv_messages), int(recv_timeout)) if latency_slo > 0 else None
+        self.shards = shards
+        self.shard_pool = None
+        #batches handed to shards: batch id -> [records, remaining parts, rows of parts, result arrays, failed]
+        self.pending = {}
+        self.sessions = SessionTracker(session_table_size, session_idle_timeout) if session_table_size > 0 else None
+        self.aggregator = BruteForceAggregator(aggregate_window, aggregate_buckets, aggregate_max_keys) if aggregate_window > 0 else None
+        self.scan_fast_path = scan_fast_path
+        self.recorder = BatchRecorder(capture_dir) if capture_dir is not None else None
 
     #--------------------------------------------------------------------------------------------
     def __del__(self):
@@ -270,7 +374,8 @@ class SSHClassifier():
         Free allocated TRAP IFCs
         """
 
-        self.trap.finalize()
+        if self.trap is not None:
+            self.trap.finalize()
 
     #--------------------------------------------------------------------------------------------
     def fetch_record(self):
@@ -279,12 +384,55 @@ class SSHClassifier():
         """
 
         #Receive input flow record from NEMEA
-        return FlowData(self.trap.recvBulk(self.ifc, time = self.recv_timeout, count = self.recv_messages))
+        count, timeout = self.controller.settings() if self.controller is not None else (self.recv_messages, self.recv_timeout)
+        with self.stats.stage('fetch'):
+            bulk = self.trap.recvBulk(self.ifc, time = timeout, count = count)
+        self.stats.count('flows_in', len(bulk))
+        with self.stats.stage('filter'):
+            continued = []
+            if self.sessions is not None:
+                bulk, continued, values = self.sessions.split(bulk, time.monotonic(), self.stats)
+            buffer = self.get_buffer() if self.use_buffers else None
+            records = FlowData(bulk, buffer)
+            if buffer is not None and records.buffer is None:
+                #buffer not used (no SSH flow or longer PPI than supported)
+                self.freeBuffers.put(buffer)
+                if records.len() > 0:
+                    #batch with longer PPI falls back to list columns and per-batch packed arrays
+                    self.stats.count('batches_unbuffered')
+            if len(continued) > 0:
+                records.continued = self.sessions.attach(continued, values, self.use_buffers)
+        if self.recorder is not None and records.len() > 0:
+            with self.stats.stage('capture'):
+                self.recorder.record(records)
+        self.stats.count('flows_ssh', records.len())
+        return records
         
         # if len(rec) <= 1:
         #     raise Exception()
         # self.ifc.setData(rec)
 
+    #--------------------------------------------------------------------------------------------
+    def get_buffer(self):
+        """
+        Get free RecordBuffer (new one is allocated if all are used by batches in processing).
+        """
+
+        try:
+            return self.freeBuffers.get_nowait()
+        except queue.Empty:
+            return RecordBuffer(int(self.recv_messages) if int(self.recv_messages) > 0 else 10000)
+
+    #--------------------------------------------------------------------------------------------
+    def release_buffer(self, records):
+        """
+        Return RecordBuffer of exported records for reuse.
+        """
+
+        if records.buffer is not None:
+            self.freeBuffers.put(records.buffer)
+            records.buffer = None
+
     #--------------------------------------------------------------------------------------------
     def initialize(self):
         """
@@ -304,17 +452,21 @@ class SSHClassifier():
         self.ifc = pytrap.UnirecTemplate(SSHClassifier.SINGLE_IFC_PYTRAP_INPUT_SPECIFICATION)
 
         #Set the output field list
-        self.alert = pytrap.UnirecTemplate(SSHClassifier.PYTRAP_OUTPUT_SPECIFICATION if not self.debug else SSHClassifier.PYTRAP_EXTENDED_OUTPUT_SPECIFICATION)
+        if self.aggregator is not None:
+            specification = SSHClassifier.PYTRAP_SUMMARY_OUTPUT_SPECIFICATION
+        else:
+            specification = SSHClassifier.PYTRAP_OUTPUT_SPECIFICATION if not self.debug else SSHClassifier.PYTRAP_EXTENDED_OUTPUT_SPECIFICATION
+        self.alert = pytrap.UnirecTemplate(specification)
 
         #Allocate memory for the UNIREC alert template and set the data output IFC format
         if not self.stdout:
             # set the data format to the output IFC
-            self.trap.setDataFmt(0, pytrap.FMT_UNIREC, SSHClassifier.PYTRAP_OUTPUT_SPECIFICATION if not self.debug else SSHClassifier.PYTRAP_EXTENDED_OUTPUT_SPECIFICATION)
+            self.trap.setDataFmt(0, pytrap.FMT_UNIREC, specification)
             #Allocate memory for the alert, we do not have any variable fields, so no argument is needed.
             self.alert.createMessage(65000)
         else:
             #print fields header for stdout output option
-            print(SSHClassifier.PYTRAP_OUTPUT_SPECIFICATION if not self.debug else SSHClassifier.PYTRAP_EXTENDED_OUTPUT_SPECIFICATION)
+            print(specification)
 
         self.initialized = True
 
@@ -327,18 +479,62 @@ class SSHClassifier():
         """
         
         #apply preprocess functions
-        records.data.apply(lambda x: preprocess(x), axis=1)     #TODO
+        with self.stats.stage('preprocess'):
+            preprocess_bulk(records)
         # records['has16'] = records.apply(lambda x: has_16(x), axis=1)
         # records['auth_start'] = records.apply(lambda x: auth_start(x), axis=1)
+        self.classify(records)
+
+    #--------------------------------------------------------------------------------------------
+    def classify(self, records):
+        """
+        Classify preprocessed records. With scan fast path, flows with too few packets after auth_start to complete authentication (AuthenticationDetector.detect_auth_fail) get fixed results (FAST_PATH_RESULTS) and only the other flows are classified.
 
+        - records: FlowData with multiple flow records
+        """
+
+        if not self.scan_fast_path:
+            self.classify_flows(records)
+            return
+
+        with self.stats.stage('scan_filter'):
+            complete = self.authentication_detector.detect_auth_fail(records).to_numpy()
+        full = int(complete.sum())
+        self.stats.count('flows_fast_path', records.len() - full)
+        self.stats.count('flows_full_path', full)
+        if full == records.len():
+            self.classify_flows(records)
+            return
+
+        rows = np.flatnonzero(complete)
+        classified = records.subset(rows)
+        if full > 0:
+            self.classify_flows(classified)
+        for column, value in SSHClassifier.FAST_PATH_RESULTS.items():
+            result = np.full(records.len(), value, dtype=object)
+            if full > 0:
+                result[rows] = classified.data[column].to_numpy()
+            records.data[column] = result
+
+    #--------------------------------------------------------------------------------------------
+    def classify_flows(self, records):
+        """
+        Predict MAC category and run detectors on preprocessed records.
+
+        - records: FlowData with multiple flow records
+        """
 
-        # NOTE auth_start and pckt_16_index needs to be already defined in DataFrame
-        # TODO change get_mac_features to process whole FlowData instead of one flow record (than implicit "lazy load" will work)
-        records.auth_start #dummy for defining auth_start and pckt_16_index
-        features_df = records.data.apply(lambda x: get_mac_features(x), axis=1)
+        with self.stats.stage('features'):
+            #calculate all used flow values at once, in dependency order (calculation times are kept in records.timings)
+            records.compute(SSHClassifier.FEATURES)
+            features = self.mac_feature_extractor.extract(records)
 
         #ML predict MAC category
-        records.data['mac_category'] = self.mac_predictor.predict(features_df)
+        with self.stats.stage('predict'):
+            if self.mac_cache is not None:
+                records.data['mac_category'] = self.mac_cache.predict(features, self.stats)
+            else:
+                records.data['mac_category'] = self.mac_predictor.predict(features)
 
         #mac category names in ML and here are not exactly same due to EtM/MtE mode (change in ML?)
         records.mac_category.replace("8 + 20", "8 + 24").replace("8 + 32", "8 + 36").replace("8 + 64", "8 + 68").replace("16 + 32", "16 + 36").replace("16 + 64", "16 + 68")
@@ -355,9 +551,12 @@ class SSHClassifier():
         - data:   flow record
         """
 
-        records.data[['result', 'method']] = self.authentication_detector.detect(records)
-        records.data['timing'] = self.timing_detector.detect(records)
-        records.data['traffic_type'] = self.traffic_type_detector.detect(records, np.where(records.data['result'] == ResultAuth.auth_ok))
+        with self.stats.stage('authentication'):
+            records.data[['result', 'method']] = self.authentication_detector.detect(records)
+        with self.stats.stage('timing'):
+            records.data['timing'] = self.timing_detector.detect(records)
+        with self.stats.stage('traffic_type'):
+            records.data['traffic_type'] = self.traffic_type_detector.detect(records, np.where(records.data['result'] == ResultAuth.auth_ok))
 
         return 
 
@@ -377,7 +576,7 @@ class SSHClassifier():
                 print(e)
                 continue
 
-            if records.len() > 0:
+            if records.len() > 0 or records.continued is not None:
                 self.recordsToProcess.put(records)
             else:
                 # Empty buffer
@@ -399,17 +598,291 @@ class SSHClassifier():
                 # timeout=5: every 5 seconds when no flow data was received, queue.Empty is thrown and
                 # I can check, if I should continue or end
                 records = self.recordsToProcess.get(timeout=5)
-                # start detection for all records in buffer
-                self.do_detection(records)
-                if not self.stdout:
-                    records.data.apply(lambda row: export_result(row, self.alert, self.debug, self.trap), axis=1)
-                    cnt += records.len()
-                else:
-                    print(records.data)
+                # start detection for all records in buffer (batch can contain follow-up records of tracked sessions only)
+                if records.len() > 0:
+                    self.do_detection(records)
+                self.export(records)
+                cnt += records.len()
                 self.recordsToProcess.task_done()
             except queue.Empty:
                 pass
 
+    #--------------------------------------------------------------------------------------------
+    def export(self, records):
+        """
+        Send detection results of all records to the output ifc (or stdout).
+        With brute-force aggregation, records are only counted and summaries are sent once the aggregation window ends.
+
+        - records: FlowData with detection results
+        """
+
+        if self.sessions is not None and records.len() > 0:
+            with self.stats.stage('sessions'):
+                self.sessions.remember(records, time.monotonic(), self.stats)
+
+        flows = 0
+        if self.aggregator is not None:
+            #flows are only counted, follow-up records of tracked sessions are not counted again
+            with self.stats.stage('aggregate'):
+                summaries = self.aggregator.update(records, self.stats) if records.len() > 0 else None
+            flows = self.export_summaries(summaries)
+        else:
+            with self.stats.stage('export'):
+                for batch in (records, records.continued):
+                    if batch is None or batch.len() == 0:
+                        continue
+                    if not self.stdout:
+                        export_bulk(batch, self.alert, self.debug, self.trap)
+                    else:
+                        print(batch.data)
+                    flows += batch.len()
+        latency = self.stats.batch_done(records.received, flows)
+        if self.controller is not None:
+            self.controller.update(latency, self.recordsToProcess.qsize(), self.stats)
+        self.release_buffer(records)
+
+    #--------------------------------------------------------------------------------------------
+    def export_summaries(self, summaries):
+        """
+        Send brute-force aggregation summaries to the output ifc (or stdout).
+
+        - summaries: pandas DataFrame from BruteForceAggregator or None
+
+        Returns:
+            number of exported summaries
+        """
+
+        if summaries is None or len(summaries) == 0:
+            return 0
+        with self.stats.stage('export'):
+            if not self.stdout:
+                export_summary(summaries, self.alert, self.trap)
+            else:
+                print(summaries)
+        self.stats.count('summaries', len(summaries))
+        return len(summaries)
+
+    #--------------------------------------------------------------------------------------------
+    def dispatcher(self):
+        """
+        Pipeline mode consumer. Takes flow data from the queue, preprocess them and hands detached copy to the worker pool.
+        Number of batches in the pipeline is limited by max_queue_size.
+        """
+
+        while self.running or not self.recordsToProcess.empty():
+            try:
+                records = self.recordsToProcess.get(timeout=5)
+            except queue.Empty:
+                continue
+
+            if records.len() == 0:
+                #follow-up records of tracked sessions only, nothing to detect
+                self.inFlight.acquire()
+                self.recordsToExport.put((records, None))
+                self.recordsToProcess.task_done()
+                continue
+
+            #preprocess in main process keeps list columns (exported in debug mode) in sync
+            with self.stats.stage('preprocess'):
+                preprocess_bulk(records)
+            detached = records.detach()
+            self.inFlight.acquire()
+            if self.ordered:
+                self.recordsToExport.put((records, self.pool.apply_async(detect_worker, (detached,))))
+            else:
+                self.pool.apply_async(detect_worker, (detached,),
+                                      callback=lambda result, records=records: self.recordsToExport.put((records, result)),
+                                      error_callback=lambda e, records=records: self.recordsToExport.put((records, e)))
+            self.recordsToProcess.task_done()
+
+        #wait for all running detections (and their callbacks) before the end mark
+        self.pool.close()
+        self.pool.join()
+        self.recordsToExport.put(None)
+
+    #--------------------------------------------------------------------------------------------
+    def exporter(self):
+        """
+        Pipeline mode output stage. Merges worker results into the records and serializes sending to the output ifc.
+        """
+
+        while True:
+            item = self.recordsToExport.get()
+            if item is None:
+                break
+
+            records, result = item
+            try:
+                if self.ordered and result is not None:
+                    result = result.get()
+                if isinstance(result, Exception):
+                    #failed worker task (unordered mode error_callback)
+                    raise result
+                if result is not None:
+                    result, (stages, counters) = result
+                    self.stats.merge(stages, counters)
+                    for column in SSHClassifier.RESULT_COLUMNS:
+                        records.data[column] = result[column].to_numpy()
+            except Exception as e:
+                self.drop_batch(records, e)
+            else:
+                try:
+                    self.export(records)
+                except Exception as e:
+                    print(e, file=sys.stderr)
+                    self.release_buffer(records)
+            self.inFlight.release()
+
+    #--------------------------------------------------------------------------------------------
+    def drop_batch(self, records, error):
+        """
+        Account batch which failed in detection. Batch is not exported, but it is counted as done (with no exported flows) and its RecordBuffer is returned for reuse.
+
+        - records: FlowData of the failed batch
+        - error:   detection exception
+        """
+
+        print(error, file=sys.stderr)
+        self.stats.count('batches_failed')
+        self.stats.batch_done(records.received, 0)
+        self.release_buffer(records)
+
+    #--------------------------------------------------------------------------------------------
+    def shard_dispatcher(self):
+        """
+        Sharded mode consumer. Takes flow data from the queue, preprocess them and hands flows to shard workers partitioned by flow key (shard_ids).
+        Batch is split into parts (flows of one shard, at most slot capacity), results of all parts are merged in shard_collector.
+        """
+
+        batch_id = 0
+        while self.running or not self.recordsToProcess.empty():
+            try:
+                records = self.recordsToProcess.get(timeout=5)
+            except queue.Empty:
+                continue
+
+            if records.len() > 0:
+                with self.stats.stage('preprocess'):
+                    preprocess_bulk(records)
+            self.inFlight.acquire()
+
+            #shared memory slots have fixed PPI width, batch with longer flows is classified here (batch can contain follow-up records of tracked sessions only)
+            if records.len() == 0 or records.ppi_lengths.shape[1] != FlowData.PPI_MAX_LEN:
+                if records.len() > 0:
+                    self.classify(records)
+                self.pending[batch_id] = [records, 0, {}, None, False]
+                self.shard_pool.results.put(('local', batch_id, None))
+            else:
+                with self.stats.stage('shard'):
+                    arrays = {key: getattr(records, key) for key in FlowData.DETACHED_ARRAYS}
+                    arrays['packet_count'] = records.packet_count.to_numpy()
+                    shard_ids = SSHClassifier.shard_ids(records, self.shards)
+
+                    parts = []
+                    for shard in range(self.shards):
+                        rows = np.flatnonzero(shard_ids == shard)
+                        for start in range(0, len(rows), self.shard_pool.capacity):
+                            parts.append((shard, rows[start:start + self.shard_pool.capacity]))
+
+                    #batch is registered before its first part can be finished
+                    results = {column: np.empty(records.len(), dtype=object) for column in SSHClassifier.RESULT_COLUMNS}
+                    self.pending[batch_id] = [records, len(parts), {part: rows for part, (_, rows) in enumerate(parts)}, results, False]
+                    for part, (shard, rows) in enumerate(parts):
+                        self.shard_pool.submit(shard, (batch_id, part), arrays, rows)
+
+            batch_id += 1
+            self.recordsToProcess.task_done()
+
+        #workers finish submitted parts before the stop mark, local batches are queued before the closed mark
+        self.shard_pool.close()
+        self.shard_pool.results.put(('closed', None, None))
+
+    #--------------------------------------------------------------------------------------------
+    @staticmethod
+    def shard_ids(records, shards):
+        """
+        Shard of every flow, crc32 of the flow key (SHARD_KEY_FIELDS) in text form.
+        Key is derived from field values (IP addresses by their textual form), so flows of one connection get the same shard in every process and run, which hash() of pytrap objects does not guarantee.
+
+        - records: FlowData with SHARD_KEY_FIELDS
+        - shards:  number of shards
+
+        Returns:
+            numpy array with shard index of every flow
+        """
+
+        keys = zip(*(records.data[field].astype(str).tolist() for field in SSHClassifier.SHARD_KEY_FIELDS))
+        return np.fromiter((zlib.crc32(' '.join(key).encode()) for key in keys), dtype=np.int64, count=records.len()) % shards
+
+    #--------------------------------------------------------------------------------------------
+    def shard_collector(self):
+        """
+        Sharded mode output stage. Merges results of batch parts from all shards into the records and serializes sending to the output ifc.
+        Batches are exported once all their parts are finished (in the receiving order in ordered mode).
+        Runs until all shard workers are done and the dispatcher closed the pool (no more local batches).
+        """
+
+        done = 0
+        closed = False
+        finished = {}
+        next_batch = 0
+        while done < self.shards or not closed:
+            kind, key, payload = self.shard_pool.results.get()
+            if kind == 'done':
+                done += 1
+                continue
+            if kind == 'closed':
+                closed = True
+                continue
+
+            if kind == 'local':
+                batch_id = key
+            else:
+                batch_id, part = key
+                entry = self.pending[batch_id]
+                if kind == 'error':
+                    print(payload, file=sys.stderr)
+                    entry[4] = True
+                else:
+                    columns, (stages, counters) = payload
+                    self.stats.merge(stages, counters)
+                    rows = entry[2][part]
+                    for column in SSHClassifier.RESULT_COLUMNS:
+                        entry[3][column][rows] = columns[column]
+                entry[1] -= 1
+                if entry[1] > 0:
+                    continue
+
+            finished[batch_id] = self.pending.pop(batch_id)
+            #unordered mode exports every batch as soon as it is finished
+            if not self.ordered:
+                next_batch = batch_id
+            while next_batch in finished:
+                self.export_shard_batch(finished.pop(next_batch))
+                next_batch += 1
+
+    #--------------------------------------------------------------------------------------------
+    def export_shard_batch(self, entry):
+        """
+        Export finished batch of the sharded mode (failed batches are dropped).
+
+        - entry: pending batch record (see pending)
+        """
+
+        records, _, _, results, failed = entry
+        if failed:
+            self.drop_batch(records, Exception(f'Dropping batch of {records.len()} flows, detection failed in a shard.'))
+        else:
+            try:
+                if results is not None:
+                    for column in SSHClassifier.RESULT_COLUMNS:
+                        records.data[column] = results[column]
+                self.export(records)
+            except Exception as e:
+                print(e, file=sys.stderr)
+                self.release_buffer(records)
+        self.inFlight.release()
+
     #--------------------------------------------------------------------------------------------
     def main(self):
         """
@@ -418,16 +891,48 @@ class SSHClassifier():
 
         """
 
+        global _worker_classifier
+
+        if self.shards > 0:
+            #fork shard workers before TRAP initialization and threads start, workers inherit loaded ML model
+            _worker_classifier = self
+            recv_messages = int(self.recv_messages) if int(self.recv_messages) > 0 else 10000
+            #key partitions are not even, larger parts are split into more slots
+            self.shard_pool = ShardPool(classify_shard, self.shards, max(1, -(-2 * recv_messages // self.shards)))
+        elif self.workers > 0:
+            #fork workers before TRAP initialization and threads start, workers inherit loaded ML model
+            _worker_classifier = self
+            self.pool = multiprocessing.get_context('fork').Pool(self.workers)
+
         self.initialize()
 
         producer = threading.Thread(target=self.producer)
-        consumer = threading.Thread(target=self.consumer)
+        if self.shard_pool is not None:
+            consumers = [threading.Thread(target=self.shard_dispatcher), threading.Thread(target=self.shard_collector)]
+        elif self.workers > 0:
+            consumers = [threading.Thread(target=self.dispatcher), threading.Thread(target=self.exporter)]
+        else:
+            consumers = [threading.Thread(target=self.consumer)]
 
+        self.stats.start()
         producer.start()
-        consumer.start()
+        for consumer in consumers:
+            consumer.start()
 
         producer.join()
-        consumer.join()
+        for consumer in consumers:
+            consumer.join()
+        if self.shard_pool is not None:
+            self.shard_pool.join()
+
+        #summaries of the last window
+        if self.aggregator is not None:
+            self.export_summaries(self.aggregator.flush())
+
+        #final statistics
+        self.stats.stop()
+        if self.stats.interval > 0 or self.stats.stats_file is not None or self.stats.stats_socket is not None:
+            self.stats.report()
     #---------------------------------------------------------------------------------------------
 
 # ------------------------------------------------------------------------------------------------
@@ -442,9 +947,28 @@ def main():
     parser.add_argument('--recv_timeout', default=10, help='recvBulk Timeout in seconds before interrupt of capture.')
     parser.add_argument('--recv_messages', default=10000, help='recvBulk Maximum number of messages to capture, infinite when -1')
     parser.add_argument('--max_queue_size', default=10, help='Max size of queue used for producer-consumer data handoff')
+    parser.add_argument('--workers', default=0, type=int, help='Number of detection worker processes (pipeline mode), 0 runs detection in a single consumer thread')
+    parser.add_argument('--ordered', action='store_true', help='Pipeline mode exports batches in the receiving order')
+    parser.add_argument('--stats_interval', default=0, type=float, help='Period of per-stage stats report (stderr line and JSON dump) in seconds, 0 disables periodic report')
+    parser.add_argument('--stats_file', default=None, help='Path of the JSON stats file rewritten on every stats report')
+    parser.add_argument('--stats_socket', default=None, help='Path of UNIX datagram socket receiving JSON stats on every stats report')
+    parser.add_argument('--flat_model', action='store_true', help='Predict MAC category by flattened tree ensemble instead of scikit-learn (same results, faster)')
+    parser.add_argument('--mac_cache_size', default=0, type=int, help='Max number of cached MAC category predictions keyed by feature signature (e.g. 4096), 0 disables the cache')
+    parser.add_argument('--latency_slo', default=0, type=float, help='Target flow latency in seconds, recvBulk size and timeout are adapted to queue backlog and processing time (recv_messages and recv_timeout are upper limits), 0 disables adaptation')
+    parser.add_argument('--shards', default=0, type=int, help='Number of shard worker processes, flows are partitioned by flow key and passed through shared memory (takes precedence over --workers), 0 disables sharding')
+    parser.add_argument('--session_table_size', default=0, type=int, help='Max number of tracked SSH sessions, detection results are attached to follow-up flow records of the same connection (split by active timeout), 0 disables tracking')
+    parser.add_argument('--session_idle_timeout', default=600, type=float, help='Seconds without any flow record of a tracked SSH session until it is dropped')
+    parser.add_argument('--aggregate_window', default=0, type=float, help='Sliding window in seconds of brute-force aggregation, per source and per source/destination summaries of authentication results are exported once per window instead of flows, 0 disables aggregation')
+    parser.add_argument('--aggregate_buckets', default=12, type=int, help='Number of time buckets of the aggregation window')
+    parser.add_argument('--aggregate_max_keys', default=65536, type=int, help='Max number of tracked aggregation keys of each kind, flows of new keys are not counted when exceeded')
+    parser.add_argument('--scan_fast_path', action='store_true', help='Mark flows which cannot contain authentication (scans, banner grabs) as failed without MAC prediction and detectors, their timing is reported as unknown')
+    parser.add_argument('--capture_dir', default=None, help='Store received SSH flow batches (after SSH filter) into the directory for offline replay (replay.py)')
     args, unknown = parser.parse_known_args()
 
-    ssh_classifier = SSHClassifier(args.mac_classifier_path, args.stdout, args.debug, args.recv_timeout, args.recv_messages, args.max_queue_size)
+    ssh_classifier = SSHClassifier(args.mac_classifier_path, args.stdout, args.debug, args.recv_timeout, args.recv_messages, int(args.max_queue_size), args.workers, args.ordered,
+                                   args.stats_interval, args.stats_file, args.stats_socket, args.flat_model, args.mac_cache_size, args.latency_slo, args.shards,
+                                   args.session_table_size, args.session_idle_timeout, args.aggregate_window, args.aggregate_buckets, args.aggregate_max_keys,
+                                   args.scan_fast_path, args.capture_dir)
     ssh_classifier.main()
 
 #------------------------------------------------------------------------------------------------
@@ -36,16 +36,14 @@ class TimingDetector():
             pandas DataFrame containing ResultAuthTiming.[user/auto]
         """
 
-        #prepare df with times in assumed authentication layer and directions
-        timing_df = pd.DataFrame()
-        timing_df['PPI_PKT_TIMES'] = records.data.apply(lambda row: row['PPI_PKT_TIMES'][row['auth_start']:row['auth_end']], axis=1)
-        timing_df['PPI_PKT_DIRECTIONS'] = records.data.apply(lambda row: row['PPI_PKT_DIRECTIONS'][row['auth_start']:row['auth_end']], axis=1)
-        
-        #calculate time differences between times 
-        time_difference = timing_df.apply(lambda row: [ (row['PPI_PKT_TIMES'][i].getTimeAsFloat() - row['PPI_PKT_TIMES'][i-1].getTimeAsFloat()) if row['PPI_PKT_DIRECTIONS'][i] == DIR_TO else 0 for i in range (1,len(row['PPI_PKT_TIMES']))], axis=1)
+        #time differences to previous packet, only client requests (DIR_TO) in assumed authentication layer are taken into account
+        times = records.ppi_times
+        positions = np.arange(1, times.shape[1])
+        auth_layer = (positions > records.auth_start.to_numpy()[:, None]) & (positions < records.auth_end.to_numpy()[:, None])
+        time_difference = np.where(auth_layer & (records.ppi_directions[:, 1:] == DIR_TO), times[:, 1:] - times[:, :-1], 0)
 
         #since using only 1 time hop, use max to get true/false value
-        return pd.DataFrame(np.where(time_difference.apply(lambda x: max(x, default=0)) > TimingDetector.HUMAN_AUTH_MIN_DELAY, ResultAuthTiming.user, ResultAuthTiming.auto))
+        return pd.DataFrame(np.where(time_difference.max(axis=1, initial=0) > TimingDetector.HUMAN_AUTH_MIN_DELAY, ResultAuthTiming.user, ResultAuthTiming.auto))
     
         #CHANGE_NOTE: previous version returns ResultAuthTiming.unknown for short connection ... #TODO it will probably crash on missing data (fix n/a)
         
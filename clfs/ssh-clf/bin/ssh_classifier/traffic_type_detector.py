@@ -70,31 +70,33 @@ class TrafficTypeDetector():
             pandas DataFrame containing column with ResultTrafficType
         """
 
-        transfer = pd.DataFrame()
+        src_major = records.hist_src_size_major.to_numpy()
+        src_perc = records.hist_src_size_perc.to_numpy()
+        dst_major = records.hist_dst_size_major.to_numpy()
+        dst_perc = records.hist_dst_size_perc.to_numpy()
+
+        #detected types are applied to authorized flows only (apply this method to other flow e.g. scan could lead to high false positives due to minimal packet count in traffic)
+        authorized = np.zeros(records.len(), dtype=bool)
+        authorized[authorized_records_idx] = True
 
         """
         Uploading and downloading data results in high number of large packet (MTU).
         Function gets the most frequent phists bin and calculate it's ratio to the packets count (sum is used instead of total flow packet count due to histogram uint limits).
         """
-        #upload
-        transfer['upload'] = np.where((records.hist_src_size_major > 6) & (records.hist_src_size_perc > TrafficTypeDetector.TRANSFER_TRESHOLD), ResultTrafficType.upload, np.nan)
-        #download
-        transfer['download'] = np.where((records.hist_dst_size_major > 6) & (records.hist_dst_size_perc > TrafficTypeDetector.TRANSFER_TRESHOLD), ResultTrafficType.download, np.nan)
-        
+        upload = authorized & (src_major > 6) & (src_perc > TrafficTypeDetector.TRANSFER_TRESHOLD)
+        download = authorized & (dst_major > 6) & (dst_perc > TrafficTypeDetector.TRANSFER_TRESHOLD)
 
         """
         shell terminal shows quite small packet in interactive typing (client send key character, server respond, client show key character on terminal).
         """
-        #terminal
-        transfer['terminal'] = np.where((records.hist_dst_size_major < 6) & (records.hist_dst_size_major > 1) & (records.hist_src_size_major >= 2) & (records.hist_src_size_major <= 3), ResultTrafficType.terminal, np.nan)
-
-        #concat all detected types in authorized flows only (apply this method to other flow e.g. scan could lead to high false positives due to minimal packet count in traffic) 
-        transfer['traffic_type'] = np.nan
-        transfer['traffic_type'] = transfer['traffic_type'].fillna(transfer['upload'].iloc[authorized_records_idx])
-        transfer['traffic_type'] = transfer['traffic_type'].fillna(transfer['download'].iloc[authorized_records_idx])
-        transfer['traffic_type'] = transfer['traffic_type'].fillna(transfer['terminal'].iloc[authorized_records_idx])
-        transfer['traffic_type'] = transfer['traffic_type'].fillna(ResultTrafficType.other)
-        
-        return transfer['traffic_type']
+        terminal = authorized & (dst_major < 6) & (dst_major > 1) & (src_major >= 2) & (src_major <= 3)
+
+        #priority upload, download, terminal (higher priority type is assigned last)
+        traffic_type = np.full(records.len(), ResultTrafficType.other, dtype=object)
+        traffic_type[terminal] = ResultTrafficType.terminal
+        traffic_type[download] = ResultTrafficType.download
+        traffic_type[upload] = ResultTrafficType.upload
+
+        return pd.Series(traffic_type, name='traffic_type')
     
     #--------------------------------------------------------------------------------------------
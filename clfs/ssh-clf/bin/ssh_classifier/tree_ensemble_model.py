@@ -0,0 +1,124 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import numpy as np
+from machine_learning_model import MachineLearningModel
+
+
+#------------------------------------------------------------------------------------------------
+class TreeEnsembleModel(MachineLearningModel):
+    """
+    Fast inference backend for exported scikit-learn tree ensemble classifier (RandomForestClassifier, ExtraTreesClassifier).
+    All trees of the loaded model are flattened into shared node arrays (feature, threshold, children, normalized leaf values) and prediction is a vectorized traversal of all trees for all distinct feature vectors at once, without sklearn per-call input validation.
+    Prediction is computed in the same way as sklearn (float32 features, per tree normalized leaf values averaged in tree order, first max class), so results match the sklearn predict.
+    """
+
+    LEAF = -1
+
+    #--------------------------------------------------------------------------------------------
+    def __init__(self, path):
+        """
+        Initialize ML from saved pkl file and flatten its trees.
+
+        - path: File path to the saved ML model in pkl format.
+        """
+
+        super().__init__(path)
+
+        if getattr(self.model, 'n_outputs_', 1) != 1 or not hasattr(self.model, 'estimators_') or \
+           not all(hasattr(estimator, 'tree_') for estimator in self.model.estimators_):
+            raise Exception(f'Model {type(self.model).__name__} is not supported single output tree ensemble classifier.')
+
+        self.classes = self.model.classes_
+        self.n_features = self.model.estimators_[0].tree_.n_features
+        features, thresholds, left, right, values, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in self.model.estimators_:
+            tree = estimator.tree_
+            leaf = tree.children_left == TreeEnsembleModel.LEAF
+
+            roots.append(offset)
+            #leaf nodes point to itself (leaf mark in flat arrays)
+            nodes = np.arange(tree.node_count) + offset
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            left.append(np.where(leaf, nodes, tree.children_left + offset))
+            right.append(np.where(leaf, nodes, tree.children_right + offset))
+
+            #DecisionTreeClassifier.predict_proba normalization
+            value = tree.value[:, 0, :]
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+
+            offset += tree.node_count
+
+        self.features = np.concatenate(features).astype(np.intp)
+        self.thresholds = np.concatenate(thresholds)
+        self.left = np.concatenate(left).astype(np.intp)
+        self.right = np.concatenate(right).astype(np.intp)
+        self.values = np.concatenate(values)
+        self.roots = np.array(roots, dtype=np.intp)
+        self.is_leaf = self.left == np.arange(offset)
+
+    #--------------------------------------------------------------------------------------------
+    def apply(self, data):
+        """
+        Find leaf node of every tree for every sample.
+
+        - data: numpy matrix with features in columns
+
+        Returns:
+            numpy array (N x number of trees) with flat leaf node indices
+        """
+
+        #sklearn casts features to float32 (values are rounded the same way)
+        data = np.asarray(data, dtype=np.float32)
+        if data.ndim != 2 or data.shape[1] != self.n_features:
+            raise Exception(f'Expected {self.n_features} features, got shape {data.shape}.')
+
+        #float32 features are compared as float64 (as in sklearn), flattened for the gather of (sample, feature) values
+        n_samples, n_trees = data.shape[0], len(self.roots)
+        flat = data.astype(np.float64).ravel()
+
+        #all trees are traversed at once, one step per tree level, only (sample, tree) pairs which did not reach a leaf yet
+        nodes = np.tile(self.roots, n_samples)
+        base = np.repeat(np.arange(n_samples) * self.n_features, n_trees)
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        while active.size > 0:
+            current = nodes[active]
+            current = np.where(flat[base[active] + self.features[current]] <= self.thresholds[current], self.left[current], self.right[current])
+            nodes[active] = current
+            active = active[~self.is_leaf[current]]
+        return nodes.reshape(n_samples, n_trees)
+
+    #--------------------------------------------------------------------------------------------
+    def predict_proba(self, data):
+        """
+        Mean of normalized leaf values over trees (summed in tree order as sklearn does).
+        """
+
+        leaves = self.apply(data)
+        proba = np.zeros((leaves.shape[0], self.values.shape[1]))
+        for tree in range(leaves.shape[1]):
+            proba += self.values[leaves[:, tree]]
+        proba /= leaves.shape[1]
+        return proba
+
+    #--------------------------------------------------------------------------------------------
+    def predict(self, data):
+        """
+        Predict classes of given dataset.
+
+        - data:   numpy matrix (or pandas data table) with given features in columns
+        """
+
+        #feature vectors repeat a lot (mostly binary features), every distinct float32 row is predicted only once
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        rows = data.view(np.dtype((np.void, data.dtype.itemsize * data.shape[1]))).ravel()
+        _, index, inverse = np.unique(rows, return_index=True, return_inverse=True)
+
+        return self.classes.take(np.argmax(self.predict_proba(data[index]), axis=1), axis=0)[inverse]
+
+    #--------------------------------------------------------------------------------------------
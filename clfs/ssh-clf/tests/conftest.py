@@ -0,0 +1,9 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import os
+import sys
+
+#classifier modules are flat scripts in bin/ssh_classifier (imported as top-level modules)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin', 'ssh_classifier'))
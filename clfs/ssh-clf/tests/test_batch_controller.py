@@ -0,0 +1,41 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+from batch_controller import BatchController
+
+
+#------------------------------------------------------------------------------------------------
+def test_unlimited_max_count():
+    controller = BatchController(2, -1)
+    assert controller.max_count == BatchController.MAX_COUNT
+    count, _ = controller.settings()
+    assert count == BatchController.INITIAL_COUNT
+
+    #backlog grows batches up to the upper limit
+    for _ in range(100):
+        controller.update(0.1, 3)
+    assert controller.settings()[0] == BatchController.MAX_COUNT
+
+#------------------------------------------------------------------------------------------------
+def test_grow_and_shrink():
+    controller = BatchController(2, 10000)
+    count, _ = controller.settings()
+    assert count < 10000
+
+    controller.update(0.1, 1)
+    assert controller.settings()[0] > count
+    for _ in range(100):
+        controller.update(0.1, 1)
+    assert controller.settings()[0] == 10000
+
+    #batch latency over SLO shrinks batches down to the lower limit
+    for _ in range(100):
+        controller.update(5, 0)
+    assert controller.settings()[0] == BatchController.MIN_COUNT
+
+#------------------------------------------------------------------------------------------------
+def test_small_max_count():
+    controller = BatchController(2, 500)
+    assert controller.settings()[0] == 500
+    assert BatchController(2, 10).settings()[0] == BatchController.MIN_COUNT
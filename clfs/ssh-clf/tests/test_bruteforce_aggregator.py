@@ -0,0 +1,72 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import pandas as pd
+
+from flow_data import FlowData, ResultAuth
+from bruteforce_aggregator import BruteForceAggregator
+
+
+#------------------------------------------------------------------------------------------------
+class Address():
+    """
+    IP address object compared by identity (like pytrap UnirecIPAddr instances of different records).
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+#------------------------------------------------------------------------------------------------
+def make_records(flows):
+    """
+    FlowData with detection results of (source, destination, time, result) flows.
+    """
+
+    records = FlowData([])
+    records.data = pd.DataFrame({
+        'SRC_IP': pd.Series([Address(source) for source, _, _, _ in flows], dtype=object),
+        'DST_IP': pd.Series([Address(destination) for _, destination, _, _ in flows], dtype=object),
+        'TIME_LAST': [time for _, _, time, _ in flows],
+        'result': pd.Series([result for _, _, _, result in flows], dtype=object),
+    })
+    return records
+
+#------------------------------------------------------------------------------------------------
+def test_equal_addresses_share_key():
+    aggregator = BruteForceAggregator(60, 12)
+    aggregator.update(make_records([('10.0.0.1', '10.1.0.1', 1000 + i, ResultAuth.fail) for i in range(5)]))
+    summaries = aggregator.flush()
+
+    pairs = summaries[summaries['AGGREGATION'] == BruteForceAggregator.PAIR]
+    sources = summaries[summaries['AGGREGATION'] == BruteForceAggregator.SOURCE]
+    assert pairs[['SRC_IP', 'DST_IP', 'FLOWS', 'AUTH_FAIL']].values.tolist() == [['10.0.0.1', '10.1.0.1', 5, 5]]
+    assert sources[['SRC_IP', 'FLOWS', 'AUTH_FAIL']].values.tolist() == [['10.0.0.1', 5, 5]]
+
+#------------------------------------------------------------------------------------------------
+def test_summary_times_of_window():
+    aggregator = BruteForceAggregator(60, 12)
+    assert aggregator.update(make_records([('10.0.0.1', '10.1.0.1', 1000, ResultAuth.fail)])) is None
+    #window of the next summary starts after the first flow
+    summaries = aggregator.update(make_records([('10.0.0.1', '10.1.0.1', 1070, ResultAuth.auth_ok), ('10.0.0.1', '10.1.0.1', 1075, ResultAuth.fail)]))
+    assert summaries['FLOWS'].tolist() == [2, 2]
+    assert summaries['TIME_FIRST'].tolist() == [1070, 1070]
+    assert summaries['TIME_LAST'].tolist() == [1075, 1075]
+
+    #key without flows since the previous summary is not reported
+    assert aggregator.update(make_records([('10.0.0.2', '10.1.0.1', 1081, ResultAuth.fail)])) is None
+    summaries = aggregator.flush()
+    assert summaries['SRC_IP'].tolist() == ['10.0.0.2', '10.0.0.2']
+    assert summaries['TIME_FIRST'].tolist() == summaries['TIME_LAST'].tolist() == [1081, 1081]
+
+#------------------------------------------------------------------------------------------------
+def test_dropped_flows_counted():
+    aggregator = BruteForceAggregator(60, 12, max_keys = 2)
+    #flow older than the window of the newest flow, flows of new keys above table size
+    aggregator.update(make_records([('10.0.0.1', '10.1.0.1', 1000, ResultAuth.fail), ('10.0.0.2', '10.1.0.1', 1100, ResultAuth.fail),
+                                    ('10.0.0.3', '10.1.0.1', 1100, ResultAuth.fail), ('10.0.0.4', '10.1.0.1', 1100, ResultAuth.fail)]))
+    assert aggregator.pairs.dropped == aggregator.sources.dropped == 2
+    assert aggregator.flush()['FLOWS'].sum() == 4
@@ -0,0 +1,129 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from flow_data import FlowData
+from flow_generator import FlowGenerator
+from mac_feature_extractor import MacFeatureExtractor
+from ssh_classifier import preprocess_bulk
+
+
+#------------------------------------------------------------------------------------------------
+def is_in_category(bs, ms, arr, min_size, mac_etm = False):
+    """
+    Reference per-flow check (former ssh_classifier.is_in_category) if the given sequence of packet sizes is valid for the given ciphersuite parameters.
+    """
+
+    etm = 4 if mac_etm else 0
+    for i in arr:
+        if ((int(i) - ms - etm) % bs == 0) == False or int(i) < min_size:
+            return False
+    return True
+
+#------------------------------------------------------------------------------------------------
+def get_mac_features(flow):
+    """
+    Reference per-flow feature extraction (former ssh_classifier.get_mac_features) replaced by MacFeatureExtractor.
+    """
+
+    features = dict.fromkeys(MacFeatureExtractor.FEATURES, False)
+    features["ssh-userauth"] = flow.PPI_PKT_LENGTHS[flow.auth_start] if flow.auth_start > 0 and flow.auth_start < len(flow.PPI_PKT_LENGTHS)-1 else 0
+
+    #bs8 - uniq packet sizes after packet 16 differ by 8 but not by 16
+    if flow.auth_start > 0 and flow.auth_start < len(flow.PPI_PKT_LENGTHS):
+        a = list(set(flow.PPI_PKT_LENGTHS[flow.auth_start:]))
+        for i in range(len(a)):
+            for j in a[i+1:]:
+                if (int(a[i]) - int(j)) % 16 and (int(a[i]) - int(j)) % 8 == 0:
+                    features["bs8"] = True
+                    break
+            if features["bs8"]:
+                break
+
+    lengths = flow.PPI_PKT_LENGTHS[flow.pckt_16_index:]
+    if is_in_category(8, 8, lengths, 16):
+        features['16+8n'] = True
+        if is_in_category(8, 16, lengths, 24):
+            features['24+8n'] = True
+            if is_in_category(8, 20, lengths, 32, True):
+                features['32+8n'] = True
+                if is_in_category(8, 32, lengths, 40):
+                    features['40+8n'] = True
+                    if is_in_category(8, 64, lengths, 72):
+                        features['72+8n'] = True
+                        if is_in_category(16, 64, lengths, 80):
+                            features['80+16n'] = True
+                    if is_in_category(16, 20, lengths, 40, True):
+                        features['40+16n'] = True
+                    if is_in_category(16, 32, lengths, 48):
+                        features['48+16n'] = True
+                if is_in_category(16, 16, lengths, 32):
+                    features['32+16n'] = True
+            if is_in_category(16, 8, lengths, 24):
+                features['24+16n'] = True
+
+    elif is_in_category(8, 12, lengths, 20):
+        features['20+8n'] = True
+        if is_in_category(8, 20, lengths, 28):
+            features['28+8n'] = True
+            if is_in_category(8, 32, lengths, 44, True):
+                features['44+8n'] = True
+                if is_in_category(8, 64, lengths, 76, True):
+                    features['76+8n'] = True
+                    if is_in_category(16, 64, lengths, 84, True):
+                        features['84+16n'] = True
+                if is_in_category(16, 32, lengths, 52, True):
+                    features['52+16n'] = True
+            if is_in_category(16, 12, lengths, 28):
+                features['28+16n'] = True
+            if is_in_category(16, 20, lengths, 36):
+                features['36+16n'] = True
+
+    return pd.Series(features)
+
+#------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_extract_matches_get_mac_features(seed):
+    records = FlowData(FlowGenerator(seed).batch(1500))
+    preprocess_bulk(records)
+    records.auth_start
+    records.pckt_16_index
+
+    expected = records.data.apply(get_mac_features, axis=1)[MacFeatureExtractor.FEATURES].astype(np.int64).to_numpy()
+    assert np.array_equal(MacFeatureExtractor().extract(records), expected)
+
+#------------------------------------------------------------------------------------------------
+def test_category_table_matches_is_in_category():
+    table = MacFeatureExtractor.build_category_table()
+    assert table.shape == (MacFeatureExtractor.TABLE_SIZE,)
+    for bit, (bs, ms, min_size, mac_etm, _) in enumerate(MacFeatureExtractor.CATEGORIES.values()):
+        valid = (table >> np.uint32(bit)) & 1 == 1
+        for length in range(0, MacFeatureExtractor.TABLE_SIZE, 7):
+            assert valid[length] == is_in_category(bs, ms, [length], min_size, mac_etm), (bit, length)
+        for length in range(0, 512):
+            assert valid[length] == is_in_category(bs, ms, [length], min_size, mac_etm), (bit, length)
+
+#------------------------------------------------------------------------------------------------
+def test_get_categories_matches_is_in_category():
+    rng = np.random.default_rng(0)
+    extractor = MacFeatureExtractor()
+    #merged packets (preprocess) can exceed the table
+    lengths = rng.choice(np.r_[np.arange(16, 160), [1500, 65535, 65536 + 36, 70000, 131072 + 52]], size=(2000, FlowData.PPI_MAX_LEN)).astype(np.int32)
+    #half of the flows has packet sizes of one category
+    parameters = list(MacFeatureExtractor.CATEGORIES.values())
+    for row in range(0, len(lengths), 2):
+        bs, _, min_size, _, _ = parameters[rng.integers(len(parameters))]
+        lengths[row] = min_size + bs * rng.integers(0, 200, FlowData.PPI_MAX_LEN)
+    starts = rng.integers(0, FlowData.PPI_MAX_LEN, len(lengths))
+    counts = rng.integers(0, FlowData.PPI_MAX_LEN + 1, len(lengths))
+    columns = np.arange(FlowData.PPI_MAX_LEN)
+    categories = extractor.get_categories(lengths, (columns >= starts[:, None]) & (columns < counts[:, None]))
+
+    for row in range(len(lengths)):
+        checked = lengths[row, starts[row]:counts[row]]
+        for bit, (bs, ms, min_size, mac_etm, _) in enumerate(MacFeatureExtractor.CATEGORIES.values()):
+            assert (categories[row] >> bit) & 1 == is_in_category(bs, ms, checked, min_size, mac_etm), (row, bit)
@@ -0,0 +1,115 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import types
+import numpy as np
+import pandas as pd
+import pytest
+
+import packet_kernels
+from flow_data import DIR_TO, DIR_FROM, FlowData
+from mac_feature_extractor import MacFeatureExtractor
+from authentication_detector import AuthenticationDetector
+
+#lengths around SSH packet size classes, 'ssh-userauth' sizes and merged packets beyond the category table
+LENGTHS = [16, 24, 28, 32, 36, 40, 44, 48, 52, 56, 64, 88, 96, 100, 300, 1000, 70000]
+
+
+#------------------------------------------------------------------------------------------------
+def python(kernel):
+    """
+    Kernel as plain Python function (without Numba compilation).
+    """
+
+    return getattr(kernel, 'py_func', kernel)
+
+#------------------------------------------------------------------------------------------------
+def packed_flows(seed, count = 500):
+    """
+    FlowData with random packed arrays (zero padded after packet_count).
+    """
+
+    rng = np.random.default_rng(seed)
+    lengths = rng.choice(LENGTHS, size=(count, FlowData.PPI_MAX_LEN)).astype(np.int32)
+    directions = rng.choice([DIR_TO, DIR_FROM], size=(count, FlowData.PPI_MAX_LEN)).astype(np.int8)
+    counts = rng.integers(0, FlowData.PPI_MAX_LEN + 1, count)
+    for row in range(count):
+        lengths[row, counts[row]:] = 0
+        directions[row, counts[row]:] = 0
+
+    records = FlowData([])
+    records.data = pd.DataFrame({'packet_count': counts, 'auth_start': rng.integers(0, 20, count)})
+    records.arrays = {'ppi_lengths': lengths, 'ppi_directions': directions}
+    return records
+
+#------------------------------------------------------------------------------------------------
+def flow(records, row):
+    """
+    Single flow of the packed FlowData as used by per-flow detection methods.
+    """
+
+    count = records.packet_count[row]
+    return types.SimpleNamespace(PPI_PKT_LENGTHS=records.ppi_lengths[row, :count].tolist(), PPI_PKT_DIRECTIONS=records.ppi_directions[row, :count].tolist(),
+                                 packet_count=count, auth_start=records.auth_start[row], mac_category=None)
+
+#------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_auth_start_pattern(seed, monkeypatch):
+    records = packed_flows(seed)
+    counts = records.packet_count.to_numpy()
+    result = python(packet_kernels.auth_start_pattern)(records.ppi_lengths, records.ppi_directions, counts, FlowData.SSH_USERAUTH_TABLE,
+                                                       FlowData.PRE_AUTH_DIR_ARRAY, FlowData.AUTH_INIT_THRESHOLD, FlowData.SESS_START_MIN)
+
+    monkeypatch.setattr(packet_kernels, 'COMPILED', False)
+    assert np.array_equal(result, FlowData.auth_start_bulk(records))
+    for row in range(records.len()):
+        if counts[row] > FlowData.SESS_START_MIN:
+            current = flow(records, row)
+            assert result[row] == FlowData.auth_start_pattern({'PPI_PKT_LENGTHS': current.PPI_PKT_LENGTHS, 'PPI_PKT_DIRECTIONS': current.PPI_PKT_DIRECTIONS}), row
+
+#------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_category_masks(seed):
+    records = packed_flows(seed)
+    extractor = MacFeatureExtractor()
+    counts = records.packet_count.to_numpy()
+    starts = np.random.default_rng(seed).integers(-1, FlowData.PPI_MAX_LEN, records.len())
+    result = python(packet_kernels.category_masks)(records.ppi_lengths, starts, counts, extractor.category_table, extractor.all_categories, MacFeatureExtractor.TABLE_PERIOD)
+
+    columns = np.arange(FlowData.PPI_MAX_LEN)
+    expected = extractor.get_categories(records.ppi_lengths, (columns >= starts[:, None]) & (columns < counts[:, None]))
+    assert result.dtype == expected.dtype
+    assert np.array_equal(result, expected)
+
+#------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_repeating(seed):
+    records = packed_flows(seed)
+    detector = AuthenticationDetector()
+    codes = python(packet_kernels.repeating)(records.ppi_lengths, records.ppi_directions, records.packet_count.to_numpy(), records.auth_start.to_numpy(),
+                                             detector.get_success_packet_sizes(records), AuthenticationDetector.MIN_PCKT_AFTER_AUTH,
+                                             AuthenticationDetector.AUTH_RESPONSE_SIZE_DIFF, DIR_FROM)
+
+    results = AuthenticationDetector.REPEATING_RESULT[codes]
+    assert len(set(codes)) == 3
+    for row in range(records.len()):
+        assert results[row] == detector.detect_repeating(flow(records, row)), row
+
+#------------------------------------------------------------------------------------------------
+@pytest.mark.skipif(not packet_kernels.COMPILED, reason='Numba is not installed')
+def test_compiled_kernels_match_python():
+    records = packed_flows(3)
+    counts = records.packet_count.to_numpy()
+    arguments = (records.ppi_lengths, records.ppi_directions, counts, FlowData.SSH_USERAUTH_TABLE, FlowData.PRE_AUTH_DIR_ARRAY,
+                 FlowData.AUTH_INIT_THRESHOLD, FlowData.SESS_START_MIN)
+    assert np.array_equal(packet_kernels.auth_start_pattern(*arguments), python(packet_kernels.auth_start_pattern)(*arguments))
+
+    extractor = MacFeatureExtractor()
+    arguments = (records.ppi_lengths, records.auth_start.to_numpy(), counts, extractor.category_table, extractor.all_categories, MacFeatureExtractor.TABLE_PERIOD)
+    assert np.array_equal(packet_kernels.category_masks(*arguments), python(packet_kernels.category_masks)(*arguments))
+
+    detector = AuthenticationDetector()
+    arguments = (records.ppi_lengths, records.ppi_directions, counts, records.auth_start.to_numpy(), detector.get_success_packet_sizes(records),
+                 AuthenticationDetector.MIN_PCKT_AFTER_AUTH, AuthenticationDetector.AUTH_RESPONSE_SIZE_DIFF, DIR_FROM)
+    assert np.array_equal(packet_kernels.repeating(*arguments), python(packet_kernels.repeating)(*arguments))
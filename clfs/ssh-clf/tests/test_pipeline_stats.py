@@ -0,0 +1,31 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import json
+import time
+
+from pipeline_stats import PipelineStats
+
+
+#------------------------------------------------------------------------------------------------
+def test_report_while_idle(tmp_path):
+    stats_file = str(tmp_path / 'stats.json')
+    stats = PipelineStats(0.05, stats_file)
+    stats.start()
+    #no batch is processed
+    deadline = time.monotonic() + 5
+    while not (tmp_path / 'stats.json').exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stats.stop()
+
+    with open(stats_file) as f:
+        assert json.load(f)['counters']['batches'] == 0
+    assert stats.reporter is None
+
+#------------------------------------------------------------------------------------------------
+def test_no_reporter_without_interval():
+    stats = PipelineStats()
+    stats.start()
+    assert stats.reporter is None
+    stats.stop()
@@ -0,0 +1,114 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import copy
+import random
+import numpy as np
+import pytest
+
+from flow_data import DIR_TO, DIR_FROM, FlowData
+from flow_generator import FlowGenerator
+from record_buffer import RecordBuffer
+from ssh_classifier import preprocess, preprocess_bulk
+
+ACK = FlowGenerator.TCP_ACK
+PSH_ACK = FlowGenerator.TCP_PSH_ACK
+
+#packet sequences (length, direction, flags) of merge corner cases, flows have to start by DIR_TO (SSH filter)
+EDGE_CASES = [
+    #ACK-only run at the start merged into the first data packet
+    [(10, DIR_TO, ACK), (20, DIR_TO, ACK), (30, DIR_TO, PSH_ACK), (40, DIR_FROM, PSH_ACK)],
+    #ACK-only run at the start followed by the opposite direction
+    [(10, DIR_TO, ACK), (20, DIR_FROM, ACK), (30, DIR_FROM, PSH_ACK), (40, DIR_TO, PSH_ACK)],
+    #ACK-only run at the end (nothing to merge into)
+    [(30, DIR_TO, PSH_ACK), (40, DIR_FROM, PSH_ACK), (10, DIR_FROM, ACK), (20, DIR_FROM, ACK)],
+    [(30, DIR_TO, PSH_ACK), (10, DIR_TO, ACK)],
+    #consecutive flag-16 packets in the middle, same and changing direction
+    [(50, DIR_TO, PSH_ACK), (5, DIR_FROM, ACK), (6, DIR_FROM, ACK), (7, DIR_FROM, ACK), (60, DIR_FROM, PSH_ACK),
+     (8, DIR_TO, ACK), (9, DIR_FROM, ACK), (70, DIR_FROM, PSH_ACK), (11, DIR_TO, ACK), (80, DIR_TO, PSH_ACK)],
+    #ACK packets only
+    [(0, DIR_TO, ACK)] * 5,
+    [(0, DIR_TO, ACK), (0, DIR_FROM, ACK)] * 3,
+    #exactly PPI_MAX_LEN packets
+    [(100 + i, DIR_TO, PSH_ACK) for i in range(FlowData.PPI_MAX_LEN)],
+    [(i, DIR_FROM if i % 3 == 1 else DIR_TO, ACK if i % 2 else PSH_ACK) for i in range(1, FlowData.PPI_MAX_LEN + 1)][::-1],
+    [(i, DIR_TO, ACK) for i in range(FlowData.PPI_MAX_LEN)],
+    [(i, DIR_TO, PSH_ACK) for i in range(FlowData.PPI_MAX_LEN - 1)] + [(7, DIR_TO, ACK)],
+]
+
+#------------------------------------------------------------------------------------------------
+def make_flow(generator, packets):
+    """
+    Generated flow record with the given packet sequence (counters set to pass SSH filter).
+    """
+
+    flow = generator.flow()
+    flow["PPI_PKT_LENGTHS"] = [length for length, _, _ in packets]
+    flow["PPI_PKT_DIRECTIONS"] = [direction for _, direction, _ in packets]
+    flow["PPI_PKT_FLAGS"] = [flags for _, _, flags in packets]
+    flow["PPI_PKT_TIMES"] = [generator.time(1000 + i * 0.5) for i in range(len(packets))]
+    flow.update({"PACKETS": 100, "PACKETS_REV": 100, "BYTES": 10000, "BYTES_REV": 10000})
+    return flow
+
+#------------------------------------------------------------------------------------------------
+def random_flows(seed, count):
+    """
+    Generated SSH flows and flows of PPI_MAX_LEN packets with random ACK runs.
+    """
+
+    generator = FlowGenerator(seed, ssh_ratio=1.0)
+    flows = [make_flow(generator, packets) for packets in EDGE_CASES]
+    assert all(FlowData.is_ssh(flow) for flow in flows)
+    flows += generator.batch(count)
+
+    rng = random.Random(seed)
+    for _ in range(count // 4):
+        packets = [(rng.randint(0, 1500), DIR_TO if i == 0 else rng.choice([DIR_TO, DIR_FROM]), rng.choice([ACK, ACK, PSH_ACK]))
+                   for i in range(rng.choice([1, 2, FlowData.PPI_MAX_LEN - 1, FlowData.PPI_MAX_LEN]))]
+        flows.append(make_flow(generator, packets))
+    return [flow for flow in flows if FlowData.is_ssh(flow)]
+
+#------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("buffered", [False, True])
+def test_preprocess_bulk_matches_preprocess(seed, buffered):
+    flows = random_flows(seed, 400)
+    expected = copy.deepcopy(flows)
+    for flow in expected:
+        preprocess(flow)
+
+    records = FlowData(copy.deepcopy(flows), RecordBuffer(16) if buffered else None)
+    assert (records.buffer is not None) == buffered
+    preprocess_bulk(records)
+
+    counts = [len(flow["PPI_PKT_LENGTHS"]) for flow in expected]
+    assert records.packet_count.tolist() == counts
+    packed = {
+        'ppi_lengths': "PPI_PKT_LENGTHS",
+        'ppi_directions': "PPI_PKT_DIRECTIONS",
+        'ppi_flags': "PPI_PKT_FLAGS",
+        'ppi_times': "PPI_PKT_TIMES",
+    }
+    for name, field in packed.items():
+        array = getattr(records, name)
+        assert array.shape == (len(flows), FlowData.PPI_MAX_LEN)
+        for row, flow in enumerate(expected):
+            values = flow[field] if name != 'ppi_times' else [t.getTimeAsFloat() for t in flow[field]]
+            assert array[row, :counts[row]].tolist() == values, (name, row)
+            assert not array[row, counts[row]:].any(), (name, row)
+
+    #list columns are kept in sync without buffer
+    if not buffered:
+        for field in packed.values():
+            assert records.data[field].tolist() == [flow[field] for flow in expected]
+
+#------------------------------------------------------------------------------------------------
+def test_preprocess_bulk_reuses_buffer():
+    buffer = RecordBuffer(16)
+    for seed in range(2):
+        flows = random_flows(seed, 100)
+        records = FlowData(flows, buffer)
+        preprocess_bulk(records)
+        for name in ('ppi_lengths', 'ppi_directions', 'ppi_flags', 'ppi_times'):
+            assert np.shares_memory(getattr(records, name), buffer.buffer)
@@ -0,0 +1,46 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import pandas as pd
+
+from flow_data import FlowData
+from flow_generator import FlowGenerator
+from session_tracker import SessionTracker
+
+
+#------------------------------------------------------------------------------------------------
+class Address():
+    """
+    IP address object compared by identity (like pytrap UnirecIPAddr instances of different records).
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+#------------------------------------------------------------------------------------------------
+def test_equal_addresses_attach_to_same_session():
+    generator = FlowGenerator(0, ssh_ratio=1.0)
+    first = generator.flow()
+    first.update({'SRC_IP': Address('10.0.0.1'), 'DST_IP': Address('192.168.1.1')})
+
+    records = FlowData([first])
+    values = ('16 + 8', 'fail', 'password', 'unknown', 'unknown', 5)
+    for column, value in zip(SessionTracker.COLUMNS, values):
+        records.data[column] = pd.Series([value], dtype=object)
+
+    tracker = SessionTracker()
+    tracker.remember(records, 0)
+
+    #follow-up record of the same connection with separately constructed addresses (no handshake)
+    follow_up = dict(first, SRC_IP=Address('10.0.0.1'), DST_IP=Address('192.168.1.1'), PPI_PKT_LENGTHS=[], PPI_PKT_DIRECTIONS=[], PPI_PKT_FLAGS=[], PPI_PKT_TIMES=[])
+    other = dict(follow_up, SRC_IP=Address('10.0.0.2'))
+    assert not FlowData.is_ssh(follow_up)
+
+    remaining, continued, remembered = tracker.split([follow_up, other], 1)
+    assert continued == [follow_up]
+    assert remaining == [other]
+    assert remembered == [values]
@@ -0,0 +1,49 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import os
+import sys
+import subprocess
+import numpy as np
+
+from flow_data import FlowData
+from flow_generator import FlowGenerator
+from ssh_classifier import SSHClassifier
+
+SHARDS = 7
+
+#shard ids of a generated batch computed in a new interpreter
+SCRIPT = """
+from flow_data import FlowData
+from flow_generator import FlowGenerator
+from ssh_classifier import SSHClassifier
+records = FlowData(FlowGenerator(1).batch(500))
+print(' '.join(map(str, SSHClassifier.shard_ids(records, %d))))
+""" % SHARDS
+
+
+#------------------------------------------------------------------------------------------------
+def test_shard_ids_same_for_equal_keys():
+    records = FlowData(FlowGenerator(0).batch(500))
+    shards = SSHClassifier.shard_ids(records, SHARDS)
+    assert shards.min() >= 0 and shards.max() < SHARDS
+    assert len(np.unique(shards)) == SHARDS
+
+    #flows of the same connection (equal key values, different objects) get the same shard
+    copy = FlowData([])
+    copy.data = records.data.copy()
+    for field in ('SRC_IP', 'DST_IP'):
+        copy.data[field] = [str(value) for value in records.data[field]]
+    assert np.array_equal(SSHClassifier.shard_ids(copy, SHARDS), shards)
+
+#------------------------------------------------------------------------------------------------
+def test_shard_ids_independent_of_hash_seed():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin', 'ssh_classifier')
+    runs = []
+    for seed in ('1', '2'):
+        env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=path)
+        runs.append(subprocess.run([sys.executable, '-c', SCRIPT], env=env, capture_output=True, text=True, check=True).stdout.split())
+
+    records = FlowData(FlowGenerator(1).batch(500))
+    assert runs[0] == runs[1] == [str(shard) for shard in SSHClassifier.shard_ids(records, SHARDS)]
@@ -0,0 +1,50 @@
+# (C) 2023 CESNET z.s.p.o. Prague, Czech Republic
+# (C) 2023 FIT CTU in Prague, Czech Republic
+# (C) 2023 FIT VUT in Brno, Czech Republic
+
+import os
+import numpy as np
+import pytest
+
+from flow_data import FlowData
+from flow_generator import FlowGenerator
+from mac_feature_extractor import MacFeatureExtractor
+from machine_learning_model import MachineLearningModel
+from tree_ensemble_model import TreeEnsembleModel
+from ssh_classifier import preprocess_bulk
+
+MAC_PKL = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bin', 'ssh_classifier', 'ssh-mac-classifier.pkl')
+
+
+#------------------------------------------------------------------------------------------------
+@pytest.fixture(scope='module')
+def models():
+    return MachineLearningModel(MAC_PKL), TreeEnsembleModel(MAC_PKL)
+
+#------------------------------------------------------------------------------------------------
+def test_predict_matches_sklearn_on_random_inputs(models):
+    sklearn_model, flat_model = models
+    rng = np.random.default_rng(0)
+    assert flat_model.n_features == len(MacFeatureExtractor.FEATURES)
+
+    #boolean features with 'ssh-userauth' packet size in the first column
+    data = rng.integers(0, 2, size=(5000, flat_model.n_features)).astype(np.int64)
+    data[:, 0] = rng.integers(0, 300, len(data))
+    assert np.array_equal(flat_model.predict(data), sklearn_model.predict(data))
+
+    #arbitrary values, also close to split thresholds
+    data = rng.normal(0, 100, size=(5000, flat_model.n_features))
+    data[:1000] = rng.choice(flat_model.thresholds, size=(1000, flat_model.n_features)) + rng.choice([-1e-6, 0.0, 1e-6], size=(1000, flat_model.n_features))
+    assert np.array_equal(flat_model.predict(data), sklearn_model.predict(data))
+    assert np.allclose(flat_model.predict_proba(data), sklearn_model.model.predict_proba(data))
+
+#------------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("seed", [0, 1])
+def test_predict_matches_sklearn_on_mac_features(models, seed):
+    sklearn_model, flat_model = models
+    records = FlowData(FlowGenerator(seed).batch(3000))
+    preprocess_bulk(records)
+    features = MacFeatureExtractor().extract(records)
+    assert len(features) > 0
+
+    assert np.array_equal(flat_model.predict(features), sklearn_model.predict(features))